@@ -2,9 +2,14 @@
 from flask import Flask
 from config import Config
 from routes import register_blueprints
+from services.google_sheet_service import gs_service
 from datetime import datetime
 
-def create_app():
+def create_app(warm_up=None, warm_up_timeout=None):
+    """
+    warm_up: precargar las hojas al arrancar (por defecto Config.SHEETS_WARMUP).
+    warm_up_timeout: segundos a esperar la precarga (None = sigue en segundo plano).
+    """
     app = Flask(__name__)
     app.config.from_object(Config)
 
@@ -19,12 +24,30 @@ def create_app():
     # Registrar todos los blueprints (incluye la raíz "/")
     register_blueprints(app)
 
+    # Refresco periódico de hojas (evita cargas en frío en las peticiones)
+    if app.config.get("SHEETS_PREFETCH"):
+        gs_service.start_scheduler()
+
+    # Escritura diferida: la cola arranca ya y adopta filas que quedaron en el spool
+    gs_service.start_write_queue()
+
+    # Precarga: autentica y descarga las hojas antes de las primeras peticiones
+    if warm_up is None:
+        warm_up = app.config.get("SHEETS_WARMUP")
+    if warm_up:
+        gs_service.warm_up(timeout=warm_up_timeout)
+
     # Variables disponibles en todas las plantillas Jinja
     @app.context_processor
     def inject_now():
         from datetime import datetime
         return {"now": datetime.now()}
 
+    # Aviso de datos desactualizados cuando Google Sheets no responde
+    @app.context_processor
+    def inject_sheets_status():
+        return {"sheets_status": gs_service.sheets_status()}
+
     return app
 
 if __name__ == "__main__":
@@ -24,29 +24,124 @@ class Config:
             'nombre': 'DATOS DE ASESOR - CENTRO PROFESIONAL DOCENTE',
             'id': os.getenv('SHEET_CREDENCIALES_ID', '148ihDOBboVOf7vDOFnqaqDSXH1dO3yB_yXiX5454UCY'),
             'worksheets': {'usuarios': 'CREDENCIALES'},
+            'ttl': 300,
+            # Login: una edición en cualquier fila (Estado, Contraseña) debe
+            # verse al vencer el TTL; el sondeo solo mira la última fila
+            'probe': False,
         },
         'ventas': {
             'id': '15sZo9tyeF-hw0Pgd8YrDgJBNkUPXBF0u6BTEj8-p3Fw',
             'worksheets': {'registro': 'QUERYS'},
+            'ttl': 60,
+            'append_only': True,
         },
         'dashboard': {
             'id': '17HJ1796Y9OuF21L8X_aveY0sic-evFda7YCLUnoHTLY',
             'worksheets': {'registro': 'NOVIEMBRE-2025'},
+            'ttl': 60,
+            'append_only': True,
         },
         'menciones': {
         'id': '1zaFo7ZJq0yAIjNwcTWJiCr3odCzs6ZYL_ibRE8yrkeM',
         'worksheets': {
             'registro': 'MENCIONES'},
+        'ttl': 600,
     },
         "cobranzas": {
             "id": "15sZo9tyeF-hw0Pgd8YrDgJBNkUPXBF0u6BTEj8-p3Fw",  # ID de la hoja de Google Sheets
             "worksheets": {
                 "registro": 'QUERYS',  # Ej: "Cobranzas 2024"
-            }
+            },
+            "ttl": 60,
+            "append_only": True,
     }
 
 }
 
+    # Caché de datos de Sheets: segundos que un snapshot se considera fresco.
+    # Cada libro puede sobrescribirlo con 'ttl' en SHEETS; vencido, se sirve el
+    # snapshot anterior mientras se refresca en segundo plano.
+    SHEETS_CACHE_TTL = int(os.getenv('SHEETS_CACHE_TTL', '60'))
+
+    # Refresco periódico en segundo plano de todas las hojas de SHEETS.
+    # El intervalo se adapta entre MIN y MAX según cuánto cambian los datos,
+    # y se alarga fuera del horario laboral (hora inicio, hora fin).
+    SHEETS_PREFETCH = os.getenv('SHEETS_PREFETCH', '0') == '1'
+    SHEETS_PREFETCH_MIN_INTERVAL = int(os.getenv('SHEETS_PREFETCH_MIN_INTERVAL', '30'))
+    SHEETS_PREFETCH_MAX_INTERVAL = int(os.getenv('SHEETS_PREFETCH_MAX_INTERVAL', '900'))
+    SHEETS_BUSINESS_HOURS = tuple(
+        int(h) for h in os.getenv('SHEETS_BUSINESS_HOURS', '8-20').split('-', 1)
+    )
+
+    # Precarga al arrancar el worker (create_app): conecta y descarga todas las
+    # hojas de SHEETS en paralelo. wsgi.py espera hasta WARMUP_TIMEOUT segundos
+    # antes de aceptar tráfico; /readyz responde 503 hasta que estén en memoria.
+    SHEETS_WARMUP = os.getenv('SHEETS_WARMUP', '0') == '1'
+    SHEETS_WARMUP_TIMEOUT = float(os.getenv('SHEETS_WARMUP_TIMEOUT', '20'))
+
+    # Descargas en paralelo (libros distintos) al cargar varias hojas a la vez
+    SHEETS_FETCH_WORKERS = int(os.getenv('SHEETS_FETCH_WORKERS', '4'))
+
+    # Hojas marcadas 'append_only' en SHEETS (respuestas de formulario): el
+    # refresco descarga solo las filas nuevas al final. Cada RECONCILE segundos
+    # se hace una descarga completa para recoger ediciones de filas anteriores.
+    SHEETS_DELTA_RECONCILE = int(os.getenv('SHEETS_DELTA_RECONCILE', '600'))
+
+    # El resto de hojas se sondea antes de refrescar (encabezados + última fila
+    # + la siguiente); si no cambió, no se descarga ni se crea versión nueva.
+    # Pasados MAX_AGE segundos desde la última descarga completa se descarga
+    # igual (ediciones en filas intermedias). 0 = sin sondeo.
+    SHEETS_PROBE_MAX_AGE = int(os.getenv('SHEETS_PROBE_MAX_AGE', '600'))
+    # El sondeo gasta una lectura igual que la descarga: en hojas de menos filas
+    # se descarga directamente (el ahorro de transferencia no compensa).
+    SHEETS_PROBE_MIN_ROWS = int(os.getenv('SHEETS_PROBE_MIN_ROWS', '2000'))
+
+    # Escritura diferida de add_record: las filas se guardan en un spool local
+    # y un hilo las escribe en lote (un append_rows por hoja) cada INTERVAL s.
+    SHEETS_WRITE_BEHIND = os.getenv('SHEETS_WRITE_BEHIND', '0') == '1'
+    SHEETS_WRITE_SPOOL = os.getenv('SHEETS_WRITE_SPOOL', str(ROOT / 'instance' / 'sheets_spool'))
+    SHEETS_WRITE_INTERVAL = float(os.getenv('SHEETS_WRITE_INTERVAL', '2'))
+    # Si una escritura falla se reintenta con espera creciente (hasta MAX_BACKOFF
+    # s); una fila que falla MAX_ATTEMPTS veces se aparta en <SPOOL>/failed/.
+    SHEETS_WRITE_MAX_ATTEMPTS = int(os.getenv('SHEETS_WRITE_MAX_ATTEMPTS', '8'))
+    SHEETS_WRITE_MAX_BACKOFF = float(os.getenv('SHEETS_WRITE_MAX_BACKOFF', '300'))
+
+    # Origen de datos: 'gspread' (Google Sheets), 'file' (pestañas grabadas en
+    # BACKEND_DIR, sin red: pruebas de carga/CI) o 'record' (Google Sheets,
+    # grabando en BACKEND_DIR lo descargado para reproducirlo con 'file').
+    SHEETS_BACKEND = os.getenv('SHEETS_BACKEND', 'gspread')
+    SHEETS_BACKEND_DIR = os.getenv('SHEETS_BACKEND_DIR', str(ROOT / 'instance' / 'sheets_fixtures'))
+
+    # Sesión HTTP del cliente de Sheets: conexiones keep-alive reutilizadas por
+    # todos los hilos (POOL por host), timeouts de conexión/lectura en segundos
+    # y renovación del token OAuth MARGIN segundos antes de que venza.
+    SHEETS_HTTP_POOL = int(os.getenv('SHEETS_HTTP_POOL', str(max(10, 2 * SHEETS_FETCH_WORKERS))))
+    SHEETS_HTTP_CONNECT_TIMEOUT = float(os.getenv('SHEETS_HTTP_CONNECT_TIMEOUT', '5'))
+    SHEETS_HTTP_READ_TIMEOUT = float(os.getenv('SHEETS_HTTP_READ_TIMEOUT', '60'))
+    SHEETS_TOKEN_REFRESH_MARGIN = int(os.getenv('SHEETS_TOKEN_REFRESH_MARGIN', '300'))
+
+    # Cuota de la API de Sheets (llamadas por minuto, por tipo). Cada llamada
+    # reserva turno antes de salir; BURST llamadas pueden ir seguidas y, si no
+    # hay turno en MAX_WAIT segundos, la operación falla en vez de colgarse.
+    # Con SHEETS_SHARED_STORE el presupuesto se comparte entre workers.
+    SHEETS_QUOTA_READS_PER_MIN = int(os.getenv('SHEETS_QUOTA_READS_PER_MIN', '60'))
+    SHEETS_QUOTA_WRITES_PER_MIN = int(os.getenv('SHEETS_QUOTA_WRITES_PER_MIN', '60'))
+    SHEETS_QUOTA_BURST = int(os.getenv('SHEETS_QUOTA_BURST', '10'))
+    SHEETS_QUOTA_MAX_WAIT = float(os.getenv('SHEETS_QUOTA_MAX_WAIT', '20'))
+
+    # Circuit breaker por libro: con al menos MIN_CALLS llamadas recientes y
+    # ERROR_RATE de fallos (errores o llamadas de más de SLOW s) el libro deja
+    # de consultarse durante OPEN_FOR s y se sirve el último snapshot bueno.
+    SHEETS_BREAKER_MIN_CALLS = int(os.getenv('SHEETS_BREAKER_MIN_CALLS', '4'))
+    SHEETS_BREAKER_ERROR_RATE = float(os.getenv('SHEETS_BREAKER_ERROR_RATE', '0.5'))
+    SHEETS_BREAKER_SLOW = float(os.getenv('SHEETS_BREAKER_SLOW', '10'))
+    SHEETS_BREAKER_OPEN_FOR = float(os.getenv('SHEETS_BREAKER_OPEN_FOR', '30'))
+
+    # Almacén de snapshots compartido entre workers de gunicorn en el mismo host
+    # (ruta a un archivo SQLite). Vacío = cada worker descarga por su cuenta.
+    SHEETS_SHARED_STORE = os.getenv('SHEETS_SHARED_STORE') or None
+    SHEETS_SHARED_WAIT = int(os.getenv('SHEETS_SHARED_WAIT', '10'))
+
     # Resuelve credenciales de Google en este orden:
     # 1) GOOGLE_SA_FILE (ruta a archivo: /etc/secrets/sa.json en Render, ./service_account.json en local)
     # 2) GOOGLE_APPLICATION_CREDENTIALS (convención Google)
@@ -16,11 +16,12 @@ from __future__ import annotations
 import sys
 import csv
 import argparse
-from datetime import datetime, date, timedelta
+from datetime import date, timedelta
 
 # Estos imports deben existir en TU proyecto
 try:
     from services.google_sheet_service import gs_service
+    from services.date_engine import parse_date
     try:
         from config import Config
     except Exception:
@@ -33,16 +34,10 @@ except Exception as e:
 
 
 def parse_date_multi(s):
-    """Parser tolerante para DD/MM/YYYY, YYYY-MM-DD, DD-MM-YYYY."""
+    """Parser tolerante (mismo motor que el servicio: DD/MM/YYYY, YYYY-MM-DD, serial, ...)."""
     if not s:
         return None
-    s = str(s).strip()
-    for fmt in ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y"):
-        try:
-            return datetime.strptime(s, fmt).date()
-        except Exception:
-            pass
-    return None
+    return parse_date(s)
 
 
 def month_bounds(y: int, m: int) -> tuple[date, date]:
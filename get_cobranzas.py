@@ -32,7 +32,7 @@ def diagnosticar_cobranzas():
 
                 if monto_total != monto_depositado:
                     fecha_venta = record.get('FECHA DE LA VENTA', '')
-                    fecha_parsed = gs_service._parse_date(fecha_venta)
+                    fecha_parsed = gs_service._parse_date_any(fecha_venta)
                     fecha_de_cobro = fecha_parsed + timedelta(days=30) if fecha_parsed else None
 
                     registros_con_diferencias.append({
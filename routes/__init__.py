@@ -9,6 +9,7 @@ from .diag import diag_bp
 from routes.cobranza import bp as cobranza_bp
 from routes.menciones import menciones_bp
 from routes.dashboard_admin import admin_bp
+from routes.health import health_bp
 @core_bp.route("/")
 def index():
     """Redirige al dashboard si hay sesión, si no al login."""
@@ -33,3 +34,4 @@ def register_blueprints(app):
     app.register_blueprint(menciones_bp)
     app.register_blueprint(cobranza_bp)
     app.register_blueprint(admin_bp)
+    app.register_blueprint(health_bp)      # /healthz, /readyz
@@ -1,5 +1,5 @@
 # routes/dashboard.py
-from flask import Blueprint, render_template, session, flash
+from flask import Blueprint, render_template, session, flash, current_app
 from routes.auth import login_required
 from services.google_sheet_service import gs_service
 from datetime import datetime
@@ -14,12 +14,25 @@ def index():
     total_registros = None
     error_fuente = None
 
+    # Fuentes del recuento en orden de preferencia; solo las configuradas
+    sheets_cfg = current_app.config.get('SHEETS') or {}
+    conteo = [(nombre, libro, hoja) for nombre, libro, hoja in (
+        ('datos', 'datos', 'datos'),
+        ('dashboard', 'dashboard', 'registro'),
+        ('ventas', 'ventas', 'registro'),
+    ) if hoja in (sheets_cfg.get(libro) or {}).get('worksheets', {})]
+
+    # Credenciales y la primera fuente del recuento se piden juntas (en paralelo)
+    pedidas = {'credenciales': ('credenciales', 'usuarios')}
+    if conteo:
+        pedidas[conteo[0][0]] = conteo[0][1:]
+    fuentes, errores = gs_service.fetch_many(pedidas, counts=[c[0] for c in conteo])
+
     # --- Lógica para el leaderboard ---
     try:
-        credenciales = gs_service.get_all_records(
-            book_name='credenciales',
-            worksheet_name='usuarios'
-        )
+        if 'credenciales' in errores:
+            raise RuntimeError(errores['credenciales'])
+        credenciales = fuentes['credenciales']
         usuarios = [
             {
                 'nombre': row.get('Nombres y Apellidos'),
@@ -72,27 +85,23 @@ def index():
         print(f"❌ Error al cargar leaderboard: {e}")
         leaderboard = []
 
-    # --- Lógica para total_registros (como en tu código original) ---
-    try:
-        datos = gs_service.get_all_records(book_name='datos', worksheet_name='datos')
-        total_registros = len(datos)
-    except Exception as e:
-        error_fuente = "datos"
-        try:
-            datos = gs_service.get_all_records(book_name='dashboard', worksheet_name='registro')
-            total_registros = len(datos)
-            error_fuente = None
-        except Exception as e2:
-            try:
-                datos = gs_service.get_all_records(book_name='ventas', worksheet_name='registro')
-                total_registros = len(datos)
-                error_fuente = None
-            except Exception as e3:
-                total_registros = 0
-                print(f"❌ No se pudo cargar recuento: {e} | {e2} | {e3}")
+    # --- Lógica para total_registros: 'datos' y si no, dashboard o ventas ---
+    for fuente, libro, hoja in conteo:
+        if fuente not in fuentes and fuente not in errores:
+            extra, err = gs_service.fetch_many({fuente: (libro, hoja)}, counts=[fuente])
+            fuentes.update(extra)
+            errores.update(err)
+        if fuente in fuentes:
+            total_registros = fuentes[fuente]
+            break
+        if error_fuente is None:
+            error_fuente = fuente
+    else:
+        total_registros = 0
+        print(f"❌ No se pudo cargar recuento: {errores}")
 
     if error_fuente == "datos":
-        flash("Aviso: El libro 'datos' no está configurado. Mostrando conteo desde otra fuente.", "info")
+        flash("Aviso: No se pudo leer el libro 'datos'. Mostrando conteo desde otra fuente.", "info")
 
     # --- Obtener la fecha y hora actual ---
     now = datetime.now()
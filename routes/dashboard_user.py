@@ -67,6 +67,12 @@ def me_dashboard():
     else:
         d_start, d_end, month_label = _bounds_from_tab(tab_title)
 
+    # Credenciales (código, comisión) y ventas se cargan juntas, en paralelo
+    gs_service.prefetch(
+        [("credenciales", "usuarios"), ("dashboard", "registro")],
+        current_app.config["SHEETS"],
+    )
+
     # --- Resolver código base desde sesión ---
     codigo = (user.get("codigo") or "").strip()
 
@@ -91,7 +97,8 @@ def me_dashboard():
         stats = {"count": 0, "total_monto": 0.0, "ventas": []}
         pct = 0.0
     else:
-        stats = gs_service.get_sales_by_code(codigo, d_start, d_end, current_app.config)
+        # Solo se muestran las 10 últimas; count/total cubren todo el rango
+        stats = gs_service.get_sales_by_code(codigo, d_start, d_end, current_app.config, limit=10)
         pct = user.get("comision")
         if pct is None:
             key_for_lookup = user_email or username
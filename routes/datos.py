@@ -43,7 +43,11 @@ def agregar():
             )
             
             if exito:
-                flash('✅ Registro agregado exitosamente', 'success')
+                # Con escritura diferida `exito` es el ticket de la cola
+                if isinstance(exito, str):
+                    flash('✅ Registro recibido, se guardará en unos segundos', 'success')
+                else:
+                    flash('✅ Registro agregado exitosamente', 'success')
                 return redirect(url_for('datos.lista'))
             else:
                 flash('❌ Error al agregar el registro', 'error')
@@ -110,6 +114,15 @@ def api_lista():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# Estado de una escritura diferida (ticket devuelto por add_record)
+@datos_bp.route('/api/escritura/<ticket>')
+@login_required
+def api_escritura(ticket):
+    estado = gs_service.write_status(ticket)
+    if estado is None:
+        return jsonify({'success': False, 'error': 'Ticket desconocido'}), 404
+    return jsonify({'success': True, 'estado': estado})
+
 # Ejemplo: Trabajar con otra hoja del mismo libro
 @datos_bp.route('/reportes')
 @login_required
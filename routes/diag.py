@@ -31,6 +31,9 @@ def diag_sheet():
         return jsonify({
             "headers": headers,
             "resolved_keys": {"PERSONAL": k_personal, "FECHA": k_fecha, "MONTO": k_monto},
+            "column_map": svc.column_map('dashboard', 'registro'),
+            "sheets_status": svc.sheets_status(),
+            "refresh_stats": svc.refresh_stats(),
             "sample_personal": sample_personal,
             "sample_fecha": sample_fecha,
             "sample_monto": sample_monto,
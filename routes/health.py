@@ -0,0 +1,18 @@
+# routes/health.py
+from flask import Blueprint, jsonify
+from services.google_sheet_service import gs_service
+
+health_bp = Blueprint("health", __name__)
+
+@health_bp.route("/healthz")
+def healthz():
+    """Liveness: el proceso responde (no toca Google Sheets)."""
+    return jsonify({"status": "ok"})
+
+@health_bp.route("/readyz")
+def readyz():
+    """Readiness: 200 solo cuando todas las hojas configuradas están en memoria."""
+    state = gs_service.readiness()
+    state["sheets"] = gs_service.sheets_status()
+    state["refresh"] = gs_service.refresh_stats()
+    return jsonify(state), (200 if state["ready"] else 503)
@@ -17,28 +17,37 @@ def index():
     page = int(request.args.get("page", 1))
     per_page = 15  # Resultados por página
 
-    # Obtener TODOS los resultados primero (sin límite)
-    all_results = svc.search_mentions(
-        current_app.config,
+    filtros = dict(
         q=q or None,
         especialidad=especialidad or None,
         p_certificado=p_certificado or None,
-        limit=None  # Sin límite para obtener todos los registros
+    )
+    # Solo la página pedida (el servicio devuelve también el total de coincidencias)
+    result = svc.search_mentions_page(
+        current_app.config, offset=(max(page, 1) - 1) * per_page, limit=per_page, **filtros
     )
 
-    # Obtener listas únicas para los selects de especialidad y P. Certificado
-    especialidades = sorted(list(set([r['especialidad'] for r in all_results if r['especialidad']])))
-    p_certificados = sorted(list(set([r['p_certificado'] for r in all_results if r['p_certificado']])))
+    # Listas únicas (con conteo) para los selects de especialidad y P. Certificado;
+    # vienen precalculadas por snapshot
+    facets = svc.mention_facets(current_app.config)
+    especialidad_counts = dict(facets["especialidad"])
+    p_certificado_counts = dict(facets["p_certificado"])
+    especialidades = [v for v, _n in facets["especialidad"]]
+    p_certificados = [v for v, _n in facets["p_certificado"]]
 
     # Calcular paginación
-    total = len(all_results)
+    total = result["total"]
     total_pages = (total + per_page - 1) // per_page  # División con redondeo hacia arriba
+    requested = page
     page = max(1, min(page, total_pages or 1))  # Asegurar que la página esté dentro del rango válido
+    if page != requested:
+        result = svc.search_mentions_page(
+            current_app.config, offset=(page - 1) * per_page, limit=per_page, **filtros
+        )
 
-    # Obtener solo los resultados de la página actual
     start_idx = (page - 1) * per_page
     end_idx = start_idx + per_page
-    paginated_results = all_results[start_idx:end_idx]
+    paginated_results = result["rows"]
 
     # Construir query strings para los enlaces de paginación
     query_params = {
@@ -69,6 +78,8 @@ def index():
         p_certificado=p_certificado,
         especialidades=especialidades,
         p_certificados=p_certificados,
+        especialidad_counts=especialidad_counts,
+        p_certificado_counts=p_certificado_counts,
         rows=paginated_results,
         pagination=pagination
     )
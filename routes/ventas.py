@@ -2,7 +2,8 @@
 from flask import Blueprint, render_template, request, flash, jsonify
 from routes.auth import login_required
 from services.google_sheet_service import gs_service
-from datetime import datetime, date, timedelta
+from services.date_engine import parse_date
+from datetime import datetime
 
 ventas_bp = Blueprint('ventas', __name__, url_prefix='/ventas')
 
@@ -38,22 +39,14 @@ def _formatea_fecha(value) -> str:
     if value in (None, ''):
         return ''
 
-    # datetime / date
-    if isinstance(value, datetime):
-        return _fecha_spanish(value)
-    if isinstance(value, date):
-        return _fecha_spanish(datetime(value.year, value.month, value.day))
+    # datetime / date / serial / ISO / formatos comunes (motor compartido)
+    d = parse_date(value)
+    if d:
+        return _fecha_spanish(d)
 
     s = str(value).strip()
 
-    # ISO: YYYY-MM-DD o YYYY-MM-DD HH:MM:SS(.ms)
-    try:
-        dt = datetime.fromisoformat(s[:19])
-        return _fecha_spanish(dt)
-    except Exception:
-        pass
-
-    # Formatos comunes
+    # Fecha con hora ('DD/MM/YYYY HH:MM:SS') o año corto ('DD/MM/YY')
     for fmt in ("%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d", "%Y-%m-%d", "%d/%m/%y"):
         try:
             dt = datetime.strptime(s[:10], fmt)
@@ -61,17 +54,8 @@ def _formatea_fecha(value) -> str:
         except Exception:
             continue
 
-    # Solo dígitos
+    # Epoch (segundos o milisegundos)
     if s.isdigit():
-        # YYYYMMDD
-        if len(s) == 8:
-            try:
-                y, m, d = int(s[0:4]), int(s[4:6]), int(s[6:8])
-                return _fecha_spanish(datetime(y, m, d))
-            except Exception:
-                pass
-
-        # Epoch (segundos o milisegundos)
         try:
             ts = int(s)
             if ts > 1_000_000_000_000:  # milisegundos
@@ -83,16 +67,6 @@ def _formatea_fecha(value) -> str:
         except Exception:
             pass
 
-        # Serial de Excel (~días desde 1899-12-30)
-        try:
-            serial = int(s)
-            if 20000 < serial < 60000:  # aprox. 1954..2064
-                base = datetime(1899, 12, 30)
-                dt = base + timedelta(days=serial)
-                return _fecha_spanish(dt)
-        except Exception:
-            pass
-
     # Fallback: devolver tal cual si no se reconoce
     return s
 
@@ -135,23 +109,10 @@ def consulta():
 
     if q:
         try:
-            # Obtiene todos los registros de la hoja de ventas
-            rows = gs_service.get_all_records(book_name='ventas', worksheet_name='registro')
-
-            # Normaliza la query a dígitos si es DNI/CEL
-            q_digits = _only_digits(q)
-
-            for r in rows:
-                dni_digits = _only_digits(str(r.get(COL_DNI, '')))
-                cel_digits = _only_digits(str(r.get(COL_CELULAR, '')))
-
-                if tipo == 'dni':
-                    match = (q_digits == dni_digits) or (q_digits and q_digits in dni_digits)
-                else:
-                    match = (q_digits == cel_digits) or (q_digits and q_digits in cel_digits)
-
-                if match:
-                    resultados.append(_row_to_view(r))
+            # Índice por dígitos de DNI/CELULAR (igual o contiene)
+            columna = COL_DNI if tipo == 'dni' else COL_CELULAR
+            rows = gs_service.find_by_digits('ventas', 'registro', columna, _only_digits(q))
+            resultados = [_row_to_view(r) for r in rows]
 
             total = len(resultados)
             if total == 0:
@@ -173,17 +134,9 @@ def api_consulta():
     data = []
     try:
         if q:
-            rows = gs_service.get_all_records(book_name='ventas', worksheet_name='registro')
-            q_digits = _only_digits(q)
-            for r in rows:
-                dni_digits = _only_digits(str(r.get(COL_DNI, '')))
-                cel_digits = _only_digits(str(r.get(COL_CELULAR, '')))
-                if tipo == 'dni':
-                    match = (q_digits == dni_digits) or (q_digits and q_digits in dni_digits)
-                else:
-                    match = (q_digits == cel_digits) or (q_digits and q_digits in cel_digits)
-                if match:
-                    data.append(_row_to_view(r))
+            columna = COL_DNI if tipo == 'dni' else COL_CELULAR
+            rows = gs_service.find_by_digits('ventas', 'registro', columna, _only_digits(q))
+            data = [_row_to_view(r) for r in rows]
         return jsonify({'success': True, 'total': len(data), 'data': data})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,134 @@
+# services/circuit_breaker.py
+# -*- coding: utf-8 -*-
+"""
+Circuit breaker por libro de Google Sheets.
+
+Cuando un libro falla seguido (errores o llamadas demasiado lentas) el
+circuito se abre: durante `open_for` segundos las llamadas a ese libro fallan
+al instante (CircuitOpen) y el servicio sirve el último snapshot bueno. Pasado
+ese tiempo se deja salir una sola llamada de prueba (half_open): si sale bien
+el circuito se cierra, si no, vuelve a abrirse.
+
+Solo cuenta lo que depende del servicio remoto: los errores de tipo `ignore`
+(p. ej. la cuota propia, QuotaWaitExceeded) no son fallos, y la espera local
+que informa `waited` no se suma a la duración de la llamada.
+"""
+import time
+import threading
+from collections import deque
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpen(RuntimeError):
+    """El circuito del libro está abierto: no se intenta la llamada."""
+
+
+class CircuitBreaker:
+    """
+    Ventana de las últimas `window` llamadas. Se abre cuando hay al menos
+    `min_calls` y la proporción de fallos (errores + llamadas de más de
+    `slow_call` segundos) llega a `error_rate`. `waited` es una función que
+    devuelve los segundos acumulados de espera local del hilo actual.
+    """
+
+    def __init__(self, window=20, min_calls=4, error_rate=0.5, slow_call=10.0, open_for=30.0,
+                 ignore=(), waited=None):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.open_for = open_for
+        self.ignore = tuple(ignore)
+        self.waited = waited
+
+        self._calls = deque(maxlen=window)   # True = fallo
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trial = False                  # hay una llamada de prueba en curso
+        self._last_error = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and time.time() - self._opened_at >= self.open_for:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """¿Puede salir una llamada? En half_open solo una a la vez."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and time.time() - self._opened_at < self.open_for:
+                return False
+            if self._trial:
+                return False
+            self._state = HALF_OPEN
+            self._trial = True
+            return True
+
+    def mark(self):
+        """Inicio de una llamada, para elapsed()."""
+        return time.time(), (self.waited() if self.waited else 0.0)
+
+    def elapsed(self, mark):
+        """Segundos desde `mark` sin contar la espera local del hilo."""
+        t0, w0 = mark
+        waited = max(0.0, self.waited() - w0) if self.waited else 0.0
+        return max(0.0, time.time() - t0 - waited)
+
+    def record(self, ok, elapsed=0.0, error=None):
+        """Registra el resultado de una llamada permitida por allow()."""
+        if not ok and isinstance(error, self.ignore):
+            # No llegó al servicio: no cuenta, pero libera el turno de prueba
+            with self._lock:
+                self._trial = False
+            return
+        failed = (not ok) or elapsed > self.slow_call
+        with self._lock:
+            if not ok:
+                self._last_error = str(error) if error else "sin respuesta"
+            elif failed:
+                self._last_error = f"llamada lenta ({elapsed:.1f}s)"
+            if self._state == HALF_OPEN:
+                self._trial = False
+                if failed:
+                    self._trip()
+                else:
+                    self._state = CLOSED
+                    self._calls.clear()
+                return
+            self._calls.append(failed)
+            if (self._state == CLOSED and len(self._calls) >= self.min_calls
+                    and sum(self._calls) / len(self._calls) >= self.error_rate):
+                self._trip()
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = time.time()
+        self._calls.clear()
+
+    def call(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs) protegido; CircuitOpen si el circuito no deja pasar."""
+        if not self.allow():
+            raise CircuitOpen(f"Circuito abierto: {self._last_error or 'demasiados fallos'}")
+        mark = self.mark()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record(False, self.elapsed(mark), e)
+            raise
+        self.record(True, self.elapsed(mark))
+        return result
+
+    def snapshot(self):
+        """Estado para diagnóstico / plantillas."""
+        state = self.state
+        with self._lock:
+            return {
+                "state": state,
+                "opened_at": self._opened_at if state != CLOSED else None,
+                "last_error": self._last_error,
+            }
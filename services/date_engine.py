@@ -0,0 +1,166 @@
+# services/date_engine.py
+# -*- coding: utf-8 -*-
+"""
+Motor de fechas compartido por el servicio de Sheets, las rutas y los scripts.
+
+- parse_date(v): misma tolerancia que tenía _parse_date_any (date/datetime,
+  serial de Sheets, dd/mm/yyyy, yyyy-mm-dd, "24 de marzo del 2025", ISO...)
+  con memoización de valores crudos.
+- parse_date_column(values): detecta una vez el formato dominante de la
+  columna, lo prueba primero en cada celda y parsea cada valor distinto una vez.
+"""
+import re
+from functools import lru_cache
+from datetime import date, datetime, timedelta
+
+_SERIAL_BASE = date(1899, 12, 30)
+
+# (formato strptime, regex equivalente, orden de los grupos -> (día, mes, año))
+_FORMATS = (
+    ("%d/%m/%Y", re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})$"), (0, 1, 2)),
+    ("%Y-%m-%d", re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})$"), (2, 1, 0)),
+    ("%d-%m-%Y", re.compile(r"(\d{1,2})-(\d{1,2})-(\d{4})$"), (0, 1, 2)),
+    ("%m/%d/%Y", re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})$"), (1, 0, 2)),
+    ("%Y/%m/%d", re.compile(r"(\d{4})/(\d{1,2})/(\d{1,2})$"), (2, 1, 0)),
+)
+
+_MESES = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6,
+    "julio": 7, "agosto": 8, "setiembre": 9, "septiembre": 9,
+    "octubre": 10, "noviembre": 11, "diciembre": 12
+}
+_TEXTO_RE = re.compile(r"(\d{1,2})\s+de\s+(\w+)(?:\s+del\s+(\d{4}))?", re.IGNORECASE)
+
+
+def _serial(n):
+    # rango aprox 1954–2064 (evita confundir "2025")
+    if 20000 <= n <= 60000:
+        return _SERIAL_BASE + timedelta(days=n)
+    return None
+
+
+def _try_format(fmt_idx, s):
+    _, rx, (i_d, i_m, i_y) = _FORMATS[fmt_idx]
+    m = rx.match(s)
+    if not m:
+        return None
+    g = m.groups()
+    try:
+        return date(int(g[i_y]), int(g[i_m]), int(g[i_d]))
+    except ValueError:
+        return None
+
+
+def _parse_str(s, first_fmt=None):
+    """Parsea un string ya recortado; `first_fmt` (índice en _FORMATS) se prueba primero."""
+    # string numérico como serial
+    if s.replace(".", "", 1).isdigit():
+        try:
+            d = _serial(float(s))
+            if d:
+                return d
+        except Exception:
+            pass
+
+    # formatos comunes (el dominante de la columna primero)
+    if first_fmt is not None:
+        d = _try_format(first_fmt, s)
+        if d:
+            return d
+    for idx in range(len(_FORMATS)):
+        if idx != first_fmt:
+            d = _try_format(idx, s)
+            if d:
+                return d
+
+    # Texto largo: "24 de marzo del 2025"
+    m = _TEXTO_RE.match(s)
+    if m:
+        mes = _MESES.get(m.group(2).lower())
+        if mes:
+            try:
+                ano = int(m.group(3)) if m.group(3) else datetime.now().year
+                return date(ano, mes, int(m.group(1)))
+            except ValueError:
+                pass
+
+    # ISO parcial
+    try:
+        return datetime.fromisoformat(s.split()[0]).date()
+    except Exception:
+        return None
+
+
+def _parse(v, first_fmt=None):
+    if isinstance(v, datetime):
+        return v.date()
+    if isinstance(v, date):
+        return v
+    if v is None or v == "":
+        return None
+
+    # Serial number directo
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        d = _serial(float(v))
+        if d:
+            return d
+
+    return _parse_str(str(v).strip(), first_fmt)
+
+
+@lru_cache(maxsize=8192, typed=True)
+def _parse_cached(v):
+    return _parse(v)
+
+
+def parse_date(v):
+    """
+    Convierte string/datetime/serial de Google Sheets a date (o None).
+    Acepta:
+      - datetime/date
+      - str en %d/%m/%Y, %Y-%m-%d, %d-%m-%Y, %m/%d/%Y, %Y/%m/%d, ISO
+      - "24 de marzo del 2025"
+      - serial de Sheets/Excel (float/int; base 1899-12-30) o string numérico
+    """
+    try:
+        return _parse_cached(v)
+    except TypeError:  # valor no hasheable
+        return _parse(v)
+
+
+def sniff_format(values, sample=200):
+    """Índice del formato de _FORMATS que más celdas de texto resuelve (o None)."""
+    hits = [0] * len(_FORMATS)
+    seen = 0
+    for v in values:
+        if not isinstance(v, str) or not v.strip():
+            continue
+        s = v.strip()
+        for idx in range(len(_FORMATS)):
+            if _try_format(idx, s):
+                hits[idx] += 1
+        seen += 1
+        if seen >= sample:
+            break
+    best = max(range(len(hits)), key=lambda i: (hits[i], -i))
+    return best if hits[best] else None
+
+
+def parse_date_column(values):
+    """
+    Parsea una columna completa: detecta el formato dominante una vez y parsea
+    cada valor distinto una sola vez. Devuelve una lista alineada con `values`.
+    """
+    first_fmt = sniff_format(values)
+    memo = {}
+    out = []
+    for v in values:
+        try:
+            k = (type(v), v)
+            d = memo[k]
+        except KeyError:
+            d = memo[k] = _parse(v, first_fmt)
+        except TypeError:
+            d = _parse(v, first_fmt)
+        out.append(d)
+    return out
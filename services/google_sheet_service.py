@@ -2,21 +2,29 @@
 # -*- coding: utf-8 -*-
 import os
 import json
+import atexit
 import time
+import uuid
 import random
+import zlib
 import unicodedata
 import logging
+import sqlite3
+import heapq
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
 from functools import wraps
-from datetime import date, datetime, timedelta
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
 
 import gspread
+from gspread.utils import absolute_range_name, rowcol_to_a1
 from google.oauth2.service_account import Credentials
-from google.auth.transport.requests import Request
-
-try:
-    import requests
-except Exception:
-    requests = None
+import requests
+from google.auth.transport.requests import Request, AuthorizedSession
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 try:
     from googleapiclient.errors import HttpError as GHttpError
@@ -24,12 +32,91 @@ except Exception:
     GHttpError = None
 
 from config import Config
+from services.sheet_snapshot import SheetSnapshot, normalize_values
+from services.sheet_scheduler import RefreshScheduler
+from services.sheet_models import Venta, Cobranza, Mencion, Asesor
+from services.sheet_columns import DictColumn
+from services.sheet_indexes import DigitIndex, TextIndex, RangeIndex, facet_counts, fold, only_digits
+from services.date_engine import parse_date, parse_date_column
+from services.snapshot_store import SnapshotStore
+from services.write_queue import WriteQueue, spool_status
+from services.quota import QuotaGovernor, QuotaWaitExceeded
+from services.circuit_breaker import CircuitBreaker, CircuitOpen, CLOSED
+from services.token_refresher import TokenRefresher
+from services.sheet_backend import make_backend
 
 _log = logging.getLogger(__name__)  # logging en vez de print()
 
+# Reintentos que quedan en la operación en curso de cada hilo (ver retry_on_quota)
+_retry_budget = threading.local()
+
+# Columnas lógicas por tipo de hoja: nombre -> (candidatos exactos, candidatos "contiene")
+COLUMN_SPECS = {
+    "asesores": {
+        "email":    (["Email"], None),
+        "username": (["Username"], None),
+        "nombre":   (["Nombres y Apellidos", "Nombres y apellidos"], None),
+        "codigo":   (["Codigo", "Código", "codigo", "code"], None),
+        "comision": (["Comisión", "Comision", "commission", "pct"], None),
+    },
+    "ventas": {
+        "personal":  (["PERSONAL"], ["personal", "asesor", "vendedor"]),
+        "fecha":     (["FECHA DE LA VENTA", "Marca temporal"], ["fecha"]),
+        "monto":     (["MONTO DEPOSITADO"], ["monto", "importe"]),
+        "cliente":   (["NOMBRE COMPLETO DEL CLIENTE", "CLIENTE"], ["cliente"]),
+        "dni":       (["DNI DEL CLIENTE", "DNI"], ["dni"]),
+        "celular":   (["CELULAR DEL CLIENTE", "CELULAR"], ["celular"]),
+        "producto":  (["TIPO DE PRODUCTO", "PRODUCTO"], ["producto"]),
+        "operacion": (["NUMERO DE OPERACIÓN", "NUMERO DE OPERACION"], ["operacion"]),
+    },
+    "cobranzas": {
+        "personal":         (["PERSONAL"], ["personal", "asesor"]),
+        "fecha":            (["FECHA DE LA VENTA"], ["fecha"]),
+        "monto_total":      (["MONTO TOTAL DE LA VENTA"], ["monto_total"]),
+        "monto_depositado": (["MONTO DEPOSITADO"], ["monto_depositado"]),
+        "cliente":          (["NOMBRE COMPLETO DEL CLIENTE"], ["cliente"]),
+        "dni":              (["DNI DEL CLIENTE"], ["dni"]),
+        "celular":          (["CELULAR DEL CLIENTE"], ["celular"]),
+        "correo":           (["CORREO DEL CLIENTE"], ["correo"]),
+        "especialidad":     (["ESPECIALIDAD"], ["especialidad"]),
+        "observaciones":    (["OBSERVACIONES"], ["observaciones"]),
+    },
+    "menciones": {
+        "nro":           (["NRO"], ["nro", "numero", "n°"]),
+        "especialidad":  (["ESPECIALIDAD"], ["especialidad"]),
+        "p_certificado": (["P. CERTIFICADO", "P CERTIFICADO", "PROCESO CERTIFICADO"], ["cert"]),
+        "mencion":       (["MENCIÓN", "MENCION"], ["mencion"]),
+        "horas":         (["HORAS"], ["horas"]),
+        "f_inicio":      (["F. INICIO", "FECHA INICIO"], ["inicio"]),
+        "f_termino":     (["F. TÉRMINO", "F. TERMINO", "FECHA TERMINO", "FECHA TÉRMINO"], ["termino", "término"]),
+        "f_emision":     (["F. EMISIÓN", "F. EMISION", "FECHA EMISION", "FECHA EMISIÓN"], ["emision", "emisión"]),
+    },
+}
+
+# Claves de orden aceptadas por search_mentions_page
+MENTION_SORT_KEYS = {
+    "fecha": lambda m: m.sort_key,
+    "horas": lambda m: m.horas if m.horas is not None else float("-inf"),
+    "nro": lambda m: m.nro,
+}
+
+# Spec de columnas que usa cada libro de Config.SHEETS
+BOOK_SPECS = {
+    "credenciales": "asesores",
+    "dashboard": "ventas",
+    "ventas": "cobranzas",
+    "cobranzas": "cobranzas",
+    "menciones": "menciones",
+}
+
 
 class GoogleSheetService:
-    """Cliente de Google Sheets con caché, reintentos y conexión perezosa (lazy connect)."""
+    """
+    Cliente de Google Sheets con caché, reintentos y conexión perezosa (lazy connect).
+    Los datos de cada hoja se guardan como snapshots versionados por (id, pestaña)
+    con TTL por libro (Config.SHEETS[libro]['ttl']); al vencer se sirve el snapshot
+    viejo y se refresca en segundo plano (stale-while-revalidate).
+    """
 
     _instance = None
 
@@ -51,12 +138,77 @@ class GoogleSheetService:
 
         self.creds = None
         self.client = None
+        self._tokens = None         # TokenRefresher del proceso
+        self._session_pid = None
         self._sheet_cache = {}
         self._ws_cache = {}
+        self._snapshots = {}        # (sheet_id, título) -> SheetSnapshot
+        self._refreshing = set()    # claves con refresh en segundo plano en curso
+        self._inflight = {}         # clave -> Future de la descarga en curso (single-flight)
+        self._full_fetch_at = {}    # clave -> última descarga completa (sondeos/incrementales)
+        self._provisional = {}      # clave -> filas escritas por este proceso aún no descargadas
+        self._overlays = {}         # clave -> (snapshot base, entradas, snapshot de provisionales)
+        self._schemas = {}          # clave -> últimos encabezados vistos (detección de cambios)
+        self._schema_cache = {}     # (encabezados, spec) -> columnas lógicas resueltas
+        self._snap_lock = threading.Lock()
+        self._client_lock = threading.Lock()   # una sola conexión por proceso
+        self._scheduler = None
+        self._store = None
+        self._store_pid = None
+        self._writes = None
+        self._writes_pid = None
+        self._pool = None
+        self._pool_pid = None
+        self._governor = None
+        self._governor_pid = None
+        self._breakers = {}         # sheet_id -> CircuitBreaker
+        self._warmup = None         # hilo de precarga (warm_up)
+        self._data_backend = None   # SheetBackend (ver _backend)
+
+        # Un fork con una descarga a medias (p. ej. precarga en el master de
+        # gunicorn --preload) dejaría locks tomados y Futures que nunca se
+        # resuelven: el hijo arranca con ese estado limpio
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+        # Al apagar el worker se escribe lo que quede en la cola diferida
+        atexit.register(self._close_writes)
 
         # Lazy connect: conecta recién en la primera operación
         self._initialized = True
 
+    def _after_fork(self):
+        self._snap_lock = threading.Lock()
+        self._client_lock = threading.Lock()
+        self._inflight = {}
+        self._refreshing = set()
+        # Los locks heredados pueden haber quedado tomados por un hilo del padre
+        for breaker in self._breakers.values():
+            breaker._lock = threading.Lock()
+            breaker._trial = False
+        # La cola heredada es del padre (su lock de dueño, su hilo): el hijo
+        # abre la suya y adopta lo que el padre ya no vaya a escribir
+        inherited, self._writes = self._writes, None
+        if inherited is not None:
+            inherited._owner_lock = None  # el fd heredado se cierra con el objeto
+            self._write_queue()
+        # Los hilos no sobreviven al fork: el scheduler que arrancó el padre
+        # (create_app con --preload) se vuelve a arrancar en cada worker,
+        # conservando los intervalos que ya había aprendido
+        scheduler = self._scheduler
+        if scheduler is not None:
+            running = scheduler._thread is not None and not scheduler._stop.is_set()
+            scheduler._lock = threading.Lock()
+            scheduler._stop = threading.Event()
+            scheduler._thread = None
+            if running:
+                self.start_scheduler()
+        # Una precarga que el padre no terminó (SHEETS_WARMUP_TIMEOUT vencido)
+        # sigue en cada worker; si no, /readyz respondería 503 hasta que el
+        # tráfico cargue las hojas que faltan
+        warmup, self._warmup = self._warmup, None
+        if warmup is not None and (warmup.is_alive() or not self.readiness()["ready"]):
+            self.warm_up()
+
     # ----------------------------------------------------------
     # Conexión
     # ----------------------------------------------------------
@@ -78,19 +230,62 @@ class GoogleSheetService:
                 info = json.loads(raw)
                 self.creds = Credentials.from_service_account_info(info, scopes=self.scopes)
 
-            probe = self.creds.with_scopes(self.scopes)
-            probe.refresh(Request())
-
-            self.client = gspread.authorize(self.creds)
+            self._authorize()
             _log.info("Conexión con Google Sheets establecida")
         except Exception as e:
             _log.error("Error al conectar con Google Sheets: %s", e, exc_info=True)
             raise
 
-    def __ensure_client(self):
+    def _authorize(self):
+        """
+        Crea el cliente gspread sobre una sesión HTTP con pool keep-alive (la
+        comparten todos los hilos) y obtiene el token de self.creds, así la
+        primera llamada no paga el viaje al endpoint de tokens. Un hilo lo
+        renueva antes de que venza.
+        """
+        pool = getattr(Config, "SHEETS_HTTP_POOL", 10)
+        # Solo se reintentan fallos de conexión (p. ej. un socket keep-alive
+        # cerrado por el servidor): la petición no llegó a salir
+        retries = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2)
+
+        def mount(session):
+            adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool, max_retries=retries)
+            session.mount("https://", adapter)
+            return session
+
+        token_request = Request(mount(requests.Session()))
+        session = mount(AuthorizedSession(self.creds, auth_request=token_request))
+
+        self.creds.refresh(token_request)  # valida las credenciales y deja el token listo
+        client = gspread.Client(self.creds, session=session)
+        client.set_timeout((getattr(Config, "SHEETS_HTTP_CONNECT_TIMEOUT", 5),
+                            getattr(Config, "SHEETS_HTTP_READ_TIMEOUT", 60)))
+
+        if self._tokens is not None:
+            self._tokens.stop()
+        self._tokens = TokenRefresher(self.creds, token_request,
+                                      margin=getattr(Config, "SHEETS_TOKEN_REFRESH_MARGIN", 300))
+        self._tokens.start()
+
+        # Libros y hojas cacheados guardan la sesión anterior
+        self._sheet_cache.clear()
+        self._ws_cache.clear()
+        self.client = client
+        self._session_pid = os.getpid()
+
+    def _ensure_client(self):
         """Asegura que la conexión esté lista antes de cualquier operación."""
-        if self.client is None:
-            self._connect()
+        if self.client is not None and self._session_pid == os.getpid():
+            return
+        # Hilos concurrentes (precarga, scheduler, requests) no deben abrir
+        # cada uno su sesión y su hilo de renovación: conecta uno solo
+        with self._client_lock:
+            if self.client is None:
+                self._connect()
+            elif self._session_pid is not None and self._session_pid != os.getpid():
+                # Tras un fork (gunicorn --preload) cada worker abre sus propios
+                # sockets y su hilo de renovación; no se comparten con el padre
+                self._authorize()
 
     # ----------------------------------------------------------
     # Utilidades de reintento
@@ -100,34 +295,62 @@ class GoogleSheetService:
         s = str(e).upper()
         return ("RESOURCE_EXHAUSTED" in s) or ("429" in s) or ("RATE_LIMIT" in s)
 
+    @staticmethod
+    def _retry_after(e: Exception):
+        """Segundos de la cabecera Retry-After del error, si la trae."""
+        resp = getattr(e, "response", None)
+        headers = getattr(resp, "headers", None) or {}
+        try:
+            return float(headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            return None
+
     @staticmethod
     def retry_on_quota(func):
-        """Reintenta en caso de error de cuota o HTTP/API con backoff exponencial."""
+        """
+        Reintenta en caso de error de cuota o HTTP/API. Las llamadas anidadas
+        comparten un solo presupuesto de reintentos por operación (lo abre la
+        más externa del hilo). Ante un 429 se pausa el bucket de cuota para
+        todos los hilos durante Retry-After (o un backoff exponencial).
+        """
         @wraps(func)
         def wrapper(self, *args, **kwargs):
             max_retries = 4
             base = 1.4
-            for attempt in range(max_retries):
-                try:
-                    return func(self, *args, **kwargs)
-                except gspread.exceptions.APIError as e:
-                    if attempt < max_retries - 1 and GoogleSheetService._is_quota_error(e):
-                        delay = (base ** attempt) + random.uniform(0, 0.5)
-                        _log.debug("APIError (cuota). Reintento %s en %.2fs", attempt + 1, delay)
-                        time.sleep(delay)
-                        continue
-                    raise
-                except Exception as e:
-                    is_http_err = (
-                        (requests and isinstance(e, requests.exceptions.HTTPError)) or
-                        (GHttpError and isinstance(e, GHttpError))
-                    )
-                    if attempt < max_retries - 1 and (is_http_err or GoogleSheetService._is_quota_error(e)):
-                        delay = (base ** attempt) + random.uniform(0, 0.5)
-                        _log.debug("HTTP/API error. Reintento %s en %.2fs", attempt + 1, delay)
+            owner = getattr(_retry_budget, "left", None) is None
+            if owner:
+                _retry_budget.left = max_retries - 1
+            try:
+                attempt = 0
+                while True:
+                    try:
+                        return func(self, *args, **kwargs)
+                    except Exception as e:
+                        is_quota = GoogleSheetService._is_quota_error(e)
+                        is_http_err = (
+                            isinstance(e, gspread.exceptions.APIError) or
+                            isinstance(e, requests.exceptions.HTTPError) or
+                            (GHttpError and isinstance(e, GHttpError))
+                        )
+                        # APIError que no es de cuota: no se reintenta (como antes)
+                        if isinstance(e, gspread.exceptions.APIError) and not is_quota:
+                            raise
+                        if _retry_budget.left <= 0 or not (is_quota or is_http_err):
+                            raise
+                        _retry_budget.left -= 1
+                        delay = GoogleSheetService._retry_after(e)
+                        if delay is None:
+                            delay = (base ** attempt) + random.uniform(0, 0.5)
+                        attempt += 1
+                        _log.debug("%s en %s. Reintento en %.2fs",
+                                   "Cuota agotada" if is_quota else "Error HTTP/API",
+                                   func.__name__, delay)
+                        if is_quota:
+                            self._quota().pause(delay)
                         time.sleep(delay)
-                        continue
-                    raise
+            finally:
+                if owner:
+                    _retry_budget.left = None
         return wrapper
 
     # ----------------------------------------------------------
@@ -136,10 +359,11 @@ class GoogleSheetService:
     @retry_on_quota
     def get_sheet_by_key(self, sheet_key):
         """Obtiene un Spreadsheet por ID con caché."""
-        self.__ensure_client()
+        self._ensure_client()
         try:
             if sheet_key in self._sheet_cache:
                 return self._sheet_cache[sheet_key]
+            self._quota().acquire("read")
             spreadsheet = self.client.open_by_key(sheet_key)
             self._sheet_cache[sheet_key] = spreadsheet
             return spreadsheet
@@ -147,6 +371,45 @@ class GoogleSheetService:
             _log.warning("No se pudo abrir el libro %s: %s", sheet_key, e)
             return None
 
+    def _resolve_source(self, book_name, worksheet_name, sheets_cfg=None):
+        """
+        Traduce (libro, hoja lógica) a (sheet_id, título real, ttl) usando
+        Config.SHEETS (o el dict `sheets_cfg` recibido). None si no está configurado.
+        """
+        if sheets_cfg is None:
+            sheets_cfg = getattr(Config, "SHEETS", {}) or {}
+        if book_name not in sheets_cfg:
+            _log.debug("Libro '%s' no encontrado en configuración", book_name)
+            return None
+
+        book_config = sheets_cfg[book_name]
+        sheet_id = book_config.get("id")
+        if not sheet_id:
+            _log.debug("ID no configurado para el libro '%s'", book_name)
+            return None
+
+        real_title = book_config.get("worksheets", {}).get(worksheet_name)
+        if not real_title:
+            _log.debug("Hoja lógica '%s' no encontrada en '%s'", worksheet_name, book_name)
+            return None
+
+        ttl = book_config.get("ttl", getattr(Config, "SHEETS_CACHE_TTL", 60))
+        return sheet_id, real_title, ttl
+
+    def _worksheet_by_title(self, sheet_id, real_title):
+        """Devuelve el Worksheet (cacheado) para (sheet_id, título real)."""
+        cache_key = (sheet_id, real_title)
+        if cache_key in self._ws_cache:
+            return self._ws_cache[cache_key]
+
+        spreadsheet = self.get_sheet_by_key(sheet_id)
+        if spreadsheet:
+            self._quota().acquire("read")
+            ws = spreadsheet.worksheet(real_title)
+            self._ws_cache[cache_key] = ws
+            return ws
+        return None
+
     @retry_on_quota
     def get_worksheet(self, book_name, worksheet_name):
         """
@@ -154,105 +417,984 @@ class GoogleSheetService:
           Config.SHEETS[book_name]['id'] y
           Config.SHEETS[book_name]['worksheets'][worksheet_name]
         """
-        self.__ensure_client()
+        self._ensure_client()
         try:
-            sheets_cfg = getattr(Config, "SHEETS", {}) or {}
-            if book_name not in sheets_cfg:
-                _log.debug("Libro '%s' no encontrado en configuración", book_name)
-                return None
-
-            book_config = sheets_cfg[book_name]
-            sheet_id = book_config.get("id")
-            if not sheet_id:
-                _log.debug("ID no configurado para el libro '%s'", book_name)
+            src = self._resolve_source(book_name, worksheet_name)
+            if not src:
                 return None
-
-            real_title = book_config.get("worksheets", {}).get(worksheet_name)
-            if not real_title:
-                _log.debug("Hoja lógica '%s' no encontrada en '%s'", worksheet_name, book_name)
-                return None
-
-            cache_key = (sheet_id, real_title)
-            if cache_key in self._ws_cache:
-                return self._ws_cache[cache_key]
-
-            spreadsheet = self.get_sheet_by_key(sheet_id)
-            if spreadsheet:
-                ws = spreadsheet.worksheet(real_title)
-                self._ws_cache[cache_key] = ws
-                return ws
-            return None
+            sheet_id, real_title, _ttl = src
+            return self._worksheet_by_title(sheet_id, real_title)
         except Exception as e:
             _log.warning("Error al obtener hoja '%s' del libro '%s': %s",
                          worksheet_name, book_name, e)
             return None
 
     # ----------------------------------------------------------
-    # Lectura / escritura
+    # Snapshots (caché de datos con TTL + stale-while-revalidate)
     # ----------------------------------------------------------
-    def _records_from_ws(self, ws):
-        """Convierte la hoja a lista de dicts (1ra fila como encabezado)."""
+    def _backend(self):
+        """Origen de datos (Config.SHEETS_BACKEND, ver services/sheet_backend.py)."""
+        if self._data_backend is None:
+            self._data_backend = make_backend(
+                self,
+                getattr(Config, "SHEETS_BACKEND", "gspread"),
+                getattr(Config, "SHEETS_BACKEND_DIR", "instance/sheets_fixtures"),
+            )
+        return self._data_backend
+
+    @retry_on_quota
+    def _fetch_values(self, sheet_id, title):
+        return self._backend().get_values(sheet_id, title)
+
+    def _shared_store(self):
+        """
+        Almacén compartido entre workers (Config.SHEETS_SHARED_STORE) o None.
+        Se abre por proceso: tras un fork (gunicorn) cada worker abre el suyo.
+        """
+        path = getattr(Config, "SHEETS_SHARED_STORE", None)
+        if not path:
+            return None
+        if self._store is None or self._store_pid != os.getpid():
+            try:
+                self._store = SnapshotStore(path)
+                self._store_pid = os.getpid()
+            except sqlite3.Error as e:
+                _log.warning("No se pudo abrir el almacén compartido %s: %s", path, e)
+                return None
+        return self._store
+
+    def _quota(self):
+        """
+        Gobernador de cuota del proceso. Con almacén compartido los buckets
+        viven en SQLite y el presupuesto por minuto es de todo el host.
+        """
+        if self._governor is None or self._governor_pid != os.getpid():
+            with self._snap_lock:
+                if self._governor is None or self._governor_pid != os.getpid():
+                    self._governor = QuotaGovernor(
+                        {"read": getattr(Config, "SHEETS_QUOTA_READS_PER_MIN", 60),
+                         "write": getattr(Config, "SHEETS_QUOTA_WRITES_PER_MIN", 60)},
+                        burst=getattr(Config, "SHEETS_QUOTA_BURST", 10),
+                        max_wait=getattr(Config, "SHEETS_QUOTA_MAX_WAIT", 20),
+                        store=self._shared_store(),
+                    )
+                    self._governor_pid = os.getpid()
+        return self._governor
+
+    def _source_ttl(self, key):
+        default = getattr(Config, "SHEETS_CACHE_TTL", 60)
+        return self._configured_sources().get(key, default)
+
+    @retry_on_quota
+    def _batch_get_values(self, sheet_id, titles):
+        """Descarga varias pestañas de un mismo libro en un solo values:batchGet."""
+        values = self._backend().batch_get(sheet_id, [absolute_range_name(t) for t in titles])
+        return dict(zip(titles, values))
+
+    def _download(self, keys):
+        """
+        {key: values} para varias hojas. Las pestañas de un mismo libro viajan
+        juntas en un batchGet y los distintos libros se piden en paralelo; las
+        que fallan se omiten del resultado.
+        """
+        self._backend().connect()
+        by_sheet = {}
+        for key in keys:
+            by_sheet.setdefault(key[0], []).append(key[1])
+
+        out = {}
+        for part in self._fan_out(self._download_sheet, list(by_sheet.items())):
+            out.update(part)
+        return out
+
+    def _download_sheet(self, sheet_id, titles):
+        """
+        {key: values} de varias pestañas de un mismo libro. Con el circuito del
+        libro abierto no se llama a la API (vacío: se sigue sirviendo lo que hay).
+        """
+        breaker = self._breaker(sheet_id)
+        if not breaker.allow():
+            _log.debug("Circuito abierto para %s: no se descarga", sheet_id)
+            return {}
+        out, error = {}, None
+        mark = breaker.mark()
         try:
-            values = ws.get_all_values(value_render_option="UNFORMATTED_VALUE")
-            if not values:
-                return []
-            headers = [h.strip() if isinstance(h, str) else h for h in (values[0] or [])]
-            rows = values[1:]
-            out = []
-            for r in rows:
-                if len(r) < len(headers):
-                    r = r + [""] * (len(headers) - len(r))
-                elif len(r) > len(headers):
-                    r = r[:len(headers)]
-                out.append(dict(zip(headers, r)))
+            if len(titles) > 1:
+                try:
+                    for title, values in self._batch_get_values(sheet_id, titles).items():
+                        out[(sheet_id, title)] = values
+                    return out
+                except Exception as e:
+                    error = e
+                    _log.debug("batchGet de %s falló, se descarga por pestaña: %s", sheet_id, e)
+            for title in titles:
+                try:
+                    out[(sheet_id, title)] = self._fetch_values(sheet_id, title)
+                except Exception as e:
+                    error = e
+                    _log.warning("No se pudo refrescar '%s' (%s): %s", title, sheet_id, e)
+            return out
+        finally:
+            breaker.record(bool(out), breaker.elapsed(mark), error)
+
+    def _breaker(self, sheet_id):
+        """Circuit breaker del libro `sheet_id` (uno por proceso y libro)."""
+        breaker = self._breakers.get(sheet_id)
+        if breaker is None:
+            with self._snap_lock:
+                breaker = self._breakers.get(sheet_id)
+                if breaker is None:
+                    breaker = self._breakers[sheet_id] = CircuitBreaker(
+                        min_calls=getattr(Config, "SHEETS_BREAKER_MIN_CALLS", 4),
+                        error_rate=getattr(Config, "SHEETS_BREAKER_ERROR_RATE", 0.5),
+                        slow_call=getattr(Config, "SHEETS_BREAKER_SLOW", 10),
+                        open_for=getattr(Config, "SHEETS_BREAKER_OPEN_FOR", 30),
+                        # La cuota propia no es una falla de Google ni su espera una llamada lenta
+                        ignore=(QuotaWaitExceeded,),
+                        waited=lambda: self._quota().waited(),
+                    )
+        return breaker
+
+    def _executor(self):
+        """Pool de hilos del proceso para descargas en paralelo (se crea al primer uso)."""
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._snap_lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=getattr(Config, "SHEETS_FETCH_WORKERS", 4),
+                        thread_name_prefix="sheets-fetch",
+                    )
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def _fan_out(self, fn, jobs):
+        """
+        [fn(*args) for args in jobs], en paralelo si hay más de uno. Las tareas
+        no deben volver a llamar a _fan_out (el pool es compartido).
+        """
+        if len(jobs) <= 1:
+            return [fn(*args) for args in jobs]
+        futures = [self._executor().submit(fn, *args) for args in jobs]
+        return [f.result() for f in futures]
+
+    def _publish(self, key, values, store=None, started_at=None):
+        """Instala `values` como nueva versión de `key` (y la publica en `store`)."""
+        headers, rows = normalize_values(values)
+        return self._publish_rows(key, headers, rows, store, started_at)
+
+    def _publish_rows(self, key, headers, rows, store=None, started_at=None):
+        """
+        Instala filas descargadas (iniciada la descarga en `started_at`) y
+        olvida las escrituras propias que la descarga ya incluye (ver _overlay).
+        """
+        fetched_at = time.time()
+        with self._snap_lock:
+            prev = self._snapshots.get(key)
+            version = prev.version + 1 if prev else 1
+        if store is not None:
+            try:
+                version = store.save(key, headers, rows, fetched_at)
+            except sqlite3.Error as e:
+                _log.warning("No se pudo publicar '%s' en el almacén compartido: %s", key[1], e)
+
+        snap = self._install(SheetSnapshot(key, version, headers, rows, fetched_at),
+                             started_at=started_at or fetched_at)
+        _log.debug("Snapshot '%s' v%s: %s filas", key[1], version, len(snap))
+        return snap
+
+    def _touch(self, snap, store=None):
+        """El snapshot sigue vigente: se renueva su antigüedad sin crear versión nueva."""
+        snap.fetched_at = time.time()
+        if store is not None:
+            try:
+                store.touch(snap.key, snap.fetched_at)
+            except sqlite3.Error as e:
+                _log.debug("No se pudo renovar '%s' en el almacén compartido: %s", snap.key[1], e)
+        return snap
+
+    def _install(self, snap, started_at=None):
+        """
+        Deja `snap` como versión vigente de su clave, avisando si cambiaron los
+        encabezados. Con `started_at` (inicio de la descarga) olvida en el mismo
+        paso las filas provisionales que `snap` ya trae: un lector nunca ve la
+        fila dos veces ni deja de verla.
+        """
+        recent = self._recent_rows(snap) if started_at is not None and snap.key in self._provisional else None
+        with self._snap_lock:
+            prev = self._schemas.get(snap.key)
+            self._snapshots[snap.key] = snap
+            self._schemas[snap.key] = snap.headers
+            if recent is not None:
+                self._prune_provisional(snap, recent, started_at)
+        if prev is not None and prev != snap.headers:
+            before, after = set(prev), set(snap.headers)
+            _log.warning(
+                "Cambiaron los encabezados de '%s' (esquema %s -> %s): nuevos=%s, quitados=%s",
+                snap.key[1], self._schema_id(prev), self._schema_id(snap.headers),
+                sorted(map(str, after - before)), sorted(map(str, before - after)),
+            )
+        return snap
+
+    def _append_only_sources(self):
+        """Claves (sheet_id, título) de las hojas marcadas 'append_only' en Config.SHEETS."""
+        sheets_cfg = getattr(Config, "SHEETS", {}) or {}
+        return {
+            key for key, books in self.source_aliases().items()
+            if any(sheets_cfg[b].get("append_only") for b, _w in books)
+        }
+
+    def _unprobed_sources(self):
+        """Claves de las hojas con 'probe': False (siempre se descargan enteras)."""
+        sheets_cfg = getattr(Config, "SHEETS", {}) or {}
+        return {
+            key for key, books in self.source_aliases().items()
+            if any(sheets_cfg[b].get("probe") is False for b, _w in books)
+        }
+
+    def _probe_plan(self, keys):
+        """
+        {clave: (tipo, snapshot, rangos A1)} de las hojas que pueden refrescarse
+        sin descargarlas enteras (hay snapshot y la última descarga completa es
+        reciente):
+          - "tail": hojas append_only -> desde la última fila conocida hasta el final
+          - "probe": resto -> fila de encabezados completa (detecta columnas
+            nuevas) + última fila conocida + la siguiente
+        El sondeo cuesta una lectura de cuota igual que la descarga: solo se usa
+        en hojas grandes (SHEETS_PROBE_MIN_ROWS), donde ahorra transferencia y
+        reconstruir índices, y nunca en las marcadas 'probe': False.
+        """
+        append_only = self._append_only_sources()
+        unprobed = self._unprobed_sources()
+        min_rows = getattr(Config, "SHEETS_PROBE_MIN_ROWS", 2000)
+        now = time.time()
+        plan = {}
+        for key in keys:
+            snap = self._snapshots.get(key)
+            if snap is None or not len(snap) or not snap.headers or key in unprobed:
+                continue
+            if key not in append_only and len(snap) < min_rows:
+                continue
+            window = getattr(Config, "SHEETS_DELTA_RECONCILE" if key in append_only
+                             else "SHEETS_PROBE_MAX_AGE", 600)
+            if now - self._full_fetch_at.get(key, 0) >= window:
+                continue
+            # Fila 1 = encabezados: la última fila conocida está en len(snap) + 1
+            last = len(snap) + 1
+            last_col = rowcol_to_a1(1, len(snap.headers)).rstrip("0123456789")
+            if key in append_only:
+                plan[key] = ("tail", snap, [absolute_range_name(key[1], f"A{last}:{last_col}")])
+            else:
+                plan[key] = ("probe", snap, [
+                    absolute_range_name(key[1], "1:1"),
+                    absolute_range_name(key[1], f"A{last}:{last_col}{last + 1}"),
+                ])
+        return plan
+
+    @retry_on_quota
+    def _batch_get_ranges(self, sheet_id, ranges):
+        """Lista de values (uno por rango A1) en un solo values:batchGet."""
+        return self._backend().batch_get(sheet_id, ranges)
+
+    def _download_probes(self, plan):
+        """{clave: [values por rango]} de `plan`; un batchGet por libro, libros en paralelo."""
+        self._backend().connect()
+        by_sheet = {}
+        for key in plan:
+            by_sheet.setdefault(key[0], []).append(key)
+
+        def probe_sheet(sheet_id, keys):
+            out = {}
+            breaker = self._breaker(sheet_id)
+            if not breaker.allow():
+                return out
+            ranges = [r for key in keys for r in plan[key][2]]
+            error = None
+            mark = breaker.mark()
+            try:
+                values = iter(self._batch_get_ranges(sheet_id, ranges))
+                for key in keys:
+                    out[key] = [next(values, []) for _ in plan[key][2]]
+            except Exception as e:
+                error = e
+                _log.debug("Sondeo de %s falló, se descarga completo: %s", sheet_id, e)
+            breaker.record(bool(out), breaker.elapsed(mark), error)
             return out
+
+        out = {}
+        for part in self._fan_out(probe_sheet, list(by_sheet.items())):
+            out.update(part)
+        return out
+
+    def _apply_tail(self, snap, tail, store=None, started_at=None):
+        """
+        Agrega al snapshot las filas nuevas de `tail` (su primera fila debe ser
+        la última conocida). None si el ancla no coincide: hubo ediciones o
+        borrados y hace falta una descarga completa.
+        """
+        _headers, tail_rows = normalize_values([snap.headers] + list(tail))
+        if not tail_rows or tail_rows[0] != snap.table.row(len(snap) - 1):
+            return None
+        new_rows = tail_rows[1:]
+        if not new_rows:
+            return self._touch(snap, store)
+        _log.debug("'%s': %s filas nuevas (descarga incremental)", snap.key[1], len(new_rows))
+        return self._publish_rows(snap.key, snap.headers, snap.rows + new_rows, store, started_at)
+
+    def _apply_probe(self, snap, header, edge, store=None):
+        """
+        Sin cambios si coinciden los encabezados y la última fila, y no hay fila
+        siguiente: se renueva el snapshot sin versión nueva (los índices
+        derivados se conservan). Si algo difiere, None (descarga completa).
+        """
+        # La API recorta las celdas vacías del final: se rellena al ancho conocido
+        header_row = list((header or [[]])[0])
+        header_row += [""] * (len(snap.headers) - len(header_row))
+        headers, edge_rows = normalize_values([header_row] + list(edge))
+        if headers != snap.headers or len(edge_rows) != 1:
+            return None
+        if edge_rows[0] != snap.table.row(len(snap) - 1):
+            return None
+        return self._touch(snap, store)
+
+    def _fetch_snapshots(self, keys, store=None):
+        """
+        Descarga las hojas `keys` = [(sheet_id, título), ...] desde la API y publica
+        nuevas versiones. Las que fallan conservan el snapshot anterior (o None).
+        Mientras la última descarga completa sea reciente, las hojas append_only
+        se refrescan con solo sus filas nuevas y el resto con un sondeo barato
+        (ver _probe_plan); solo se descargan enteras si el sondeo ve cambios.
+        """
+        out = {}
+        started_at = time.time()
+        plan = self._probe_plan(keys)
+        if plan:
+            try:
+                probed = self._download_probes(plan)
+            except Exception as e:
+                _log.debug("Sondeo de hojas falló: %s", e)
+                probed = {}
+            for key, values in probed.items():
+                kind, snap = plan[key][0], plan[key][1]
+                if kind == "tail":
+                    snap = self._apply_tail(snap, values[0], store, started_at)
+                else:
+                    snap = self._apply_probe(snap, values[0], values[1], store)
+                if snap is not None:
+                    out[key] = snap
+
+        full = [key for key in keys if key not in out]
+        if full:
+            try:
+                downloaded = self._download(full)
+            except Exception as e:
+                _log.warning("No se pudieron refrescar %s hojas: %s", len(full), e)
+                downloaded = {}
+            for key in full:
+                if key in downloaded:
+                    out[key] = self._publish(key, downloaded[key], store, started_at)
+                    self._full_fetch_at[key] = started_at
+                else:
+                    out[key] = self._snapshots.get(key) or self._stale_snapshot(store, key)
+        return out
+
+    def _stale_snapshot(self, store, key):
+        """
+        Sin descarga posible y sin snapshot en memoria: el último bueno del
+        almacén compartido, aunque esté vencido (mejor datos viejos que vacíos).
+        """
+        store = store or self._shared_store()
+        if store is None:
+            return None
+        try:
+            snap = self._adopt_from_store(store, key, stale_ok=True)
+        except sqlite3.Error as e:
+            _log.debug("No se pudo leer '%s' del almacén compartido: %s", key[1], e)
+            return None
+        if snap is not None:
+            _log.info("Se sirve '%s' con %.0fs de antigüedad (sin conexión con Sheets)", key[1], snap.age)
+        return snap
+
+    def _adopt_from_store(self, store, key, stale_ok=False):
+        """
+        Instala la versión publicada por otro worker si sigue vigente (o
+        cualquiera, con stale_ok); si no, None.
+        """
+        meta = store.meta(key)
+        if not meta:
+            return None
+        version, fetched_at = meta
+        if not stale_ok and time.time() - fetched_at > self._source_ttl(key):
+            return None
+
+        current = self._snapshots.get(key)
+        if current is not None and current.version >= version:
+            # Misma versión verificada por otro worker: vale como renovada
+            current.fetched_at = max(current.fetched_at, fetched_at)
+            return current
+        loaded = store.load(key)
+        if not loaded:
+            return None
+        version, fetched_at, headers, rows = loaded
+        return self._install(SheetSnapshot(key, version, headers, rows, fetched_at), started_at=fetched_at)
+
+    def _wait_for_store(self, store, key):
+        """
+        Otro worker está descargando `key`: si hay snapshot viejo se sirve ese,
+        si es carga en frío se espera un poco a que publique y luego se descarga.
+        """
+        current = self._snapshots.get(key)
+        if current is not None:
+            return current
+        deadline = time.time() + getattr(Config, "SHEETS_SHARED_WAIT", 10)
+        while time.time() < deadline:
+            time.sleep(0.2)
+            snap = self._adopt_from_store(store, key)
+            if snap is not None:
+                return snap
+        return self._fetch_snapshots([key])[key]
+
+    def _load_snapshots(self, keys):
+        """
+        Publica nuevas versiones de varias hojas. Con almacén compartido solo
+        descarga el worker que obtiene el lease de cada hoja; el resto adopta lo
+        que ese publique.
+        """
+        store = self._shared_store()
+        if store is None:
+            return self._fetch_snapshots(keys)
+
+        out, mine, waiting = {}, [], []
+        try:
+            for key in keys:
+                snap = self._adopt_from_store(store, key)
+                if snap is not None:
+                    out[key] = snap
+                elif store.try_acquire(key):
+                    mine.append(key)
+                else:
+                    waiting.append(key)
+            if mine:
+                try:
+                    out.update(self._fetch_snapshots(mine, store))
+                finally:
+                    for key in mine:
+                        store.release(key)
+            for key in waiting:
+                out[key] = self._wait_for_store(store, key)
+        except sqlite3.Error as e:
+            _log.warning("Almacén compartido no disponible: %s", e)
+            out.update(self._fetch_snapshots([k for k in keys if k not in out]))
+        return out
+
+    def _refresh_snapshots(self, keys):
+        """
+        Refresca varias hojas con single-flight: si otro hilo ya está cargando una
+        clave, se espera su resultado en vez de lanzar otra descarga.
+        """
+        leading, following = {}, {}
+        with self._snap_lock:
+            for key in dict.fromkeys(keys):
+                fut = self._inflight.get(key)
+                if fut is None:
+                    fut = self._inflight[key] = Future()
+                    leading[key] = fut
+                else:
+                    following[key] = fut
+
+        out = {}
+        if leading:
+            try:
+                out = self._load_snapshots(list(leading))
+            except Exception as e:
+                for fut in leading.values():
+                    fut.set_exception(e)
+                raise
+            finally:
+                with self._snap_lock:
+                    for key in leading:
+                        self._inflight.pop(key, None)
+                for key, fut in leading.items():
+                    if not fut.done():
+                        fut.set_result(out.get(key))
+        for key, fut in following.items():
+            out[key] = fut.result()
+        return out
+
+    def _refresh_snapshot(self, key):
+        return self._refresh_snapshots([key]).get(key)
+
+    def _refresh_in_background(self, key):
+        """Lanza un único refresh en segundo plano por clave."""
+        with self._snap_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self._refresh_snapshot(key)
+            finally:
+                with self._snap_lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name=f"sheets-refresh-{key[1]}", daemon=True).start()
+
+    def _get_snapshot(self, book_name, worksheet_name, sheets_cfg=None):
+        """
+        Devuelve el snapshot de (libro, hoja lógica):
+          - sin snapshot: descarga en línea (carga en frío)
+          - snapshot vencido: lo devuelve igual y refresca en segundo plano
+        """
+        src = self._resolve_source(book_name, worksheet_name, sheets_cfg)
+        if not src:
+            return None
+        sheet_id, real_title, ttl = src
+        key = (sheet_id, real_title)
+
+        snap = self._snapshots.get(key)
+        if snap is None:
+            return self._refresh_snapshot(key)
+        if snap.age > ttl:
+            self._refresh_in_background(key)
+        return snap
+
+    def source_aliases(self):
+        """
+        {(sheet_id, título): [(libro, hoja lógica), ...]} de Config.SHEETS.
+        Varios libros lógicos que apuntan a la misma pestaña (p. ej. 'ventas' y
+        'cobranzas' -> QUERYS) comparten un único snapshot y una única descarga.
+        """
+        aliases = {}
+        for book_name, book_config in (getattr(Config, "SHEETS", {}) or {}).items():
+            for worksheet_name in (book_config.get("worksheets") or {}):
+                src = self._resolve_source(book_name, worksheet_name)
+                if src:
+                    aliases.setdefault((src[0], src[1]), []).append((book_name, worksheet_name))
+        return aliases
+
+    def _configured_sources(self):
+        """{(sheet_id, título): ttl} de todas las hojas declaradas (el menor TTL de sus alias)."""
+        sources = {}
+        for key, books in self.source_aliases().items():
+            sources[key] = min(self._resolve_source(b, w)[2] for b, w in books)
+        return sources
+
+    def prefetch(self, sources, sheets_cfg=None):
+        """
+        Calienta varias hojas [(libro, hoja lógica), ...] de una vez: las que no
+        tienen snapshot se descargan ya (agrupadas por libro en un batchGet,
+        libros en paralelo) y las vencidas se refrescan en segundo plano.
+        """
+        cold = []
+        for book_name, worksheet_name in sources:
+            src = self._resolve_source(book_name, worksheet_name, sheets_cfg)
+            if not src:
+                continue
+            key = (src[0], src[1])
+            snap = self._snapshots.get(key)
+            if snap is None:
+                cold.append(key)
+            elif snap.age > src[2]:
+                self._refresh_in_background(key)
+        if cold:
+            self._refresh_snapshots(cold)
+
+    def fetch_many(self, sources, sheets_cfg=None, counts=()):
+        """
+        Carga varias hojas a la vez: `sources` = {nombre: (libro, hoja lógica)}.
+        Las que no están en memoria se descargan juntas (un batchGet por libro,
+        libros en paralelo), así la espera es la de la descarga más lenta y no
+        la suma. Devuelve (registros, errores), ambos {nombre: ...}; una fuente
+        sin configurar o que no se pudo cargar aparece solo en errores. Para los
+        nombres en `counts` se devuelve solo el número de filas (sin armar dicts).
+        """
+        keys, errors = {}, {}
+        for name, (book_name, worksheet_name) in sources.items():
+            src = self._resolve_source(book_name, worksheet_name, sheets_cfg)
+            if src:
+                keys[name] = (src[0], src[1])
+            else:
+                errors[name] = f"'{book_name}/{worksheet_name}' no está configurado"
+
+        try:
+            self.prefetch([sources[name] for name in keys], sheets_cfg)
         except Exception as e:
-            _log.warning("Error al mapear registros: %s", e)
-            return []
+            _log.warning("fetch_many: error al descargar: %s", e)
+
+        records = {}
+        for name, key in keys.items():
+            snap = self._snapshots.get(key)
+            if snap is None:
+                errors[name] = f"No se pudo cargar '{key[1]}'"
+            elif name in counts:
+                records[name] = sum(len(layer) for layer in self._layers(snap))
+            else:
+                records[name] = [r for layer in self._layers(snap) for r in layer.records()]
+        return records, errors
 
+    def warm_up(self, timeout=None):
+        """
+        Conecta y carga todas las hojas configuradas (un batchGet por libro,
+        libros en paralelo) en un hilo aparte. Espera hasta `timeout` segundos
+        (None = no espera) y devuelve True si ya quedó todo en memoria.
+        """
+        with self._snap_lock:
+            thread = self._warmup
+            if thread is None or not thread.is_alive():
+                thread = self._warmup = threading.Thread(
+                    target=self._warm_up, name="sheets-warmup", daemon=True)
+                thread.start()
+        if timeout:
+            thread.join(timeout)
+        return self.readiness()["ready"]
+
+    def _warm_up(self):
+        t0 = time.time()
+        keys = list(self._configured_sources())
+        try:
+            self._backend().connect()
+            self._refresh_snapshots(keys)
+        except Exception as e:
+            _log.warning("Precarga de hojas incompleta: %s", e)
+        _log.info("Precarga de hojas: %s/%s en %.1fs",
+                  sum(1 for k in keys if k in self._snapshots), len(keys), time.time() - t0)
+
+    def readiness(self):
+        """
+        {"ready": bool, "loaded": [...], "missing": [...]}: listo cuando todas
+        las hojas configuradas tienen snapshot en memoria (aunque sea viejo).
+        """
+        loaded, missing = [], []
+        for key, books in self.source_aliases().items():
+            name = "/".join(books[0])
+            (loaded if key in self._snapshots else missing).append(name)
+        return {"ready": not missing, "loaded": loaded, "missing": missing}
+
+    def start_scheduler(self):
+        """Arranca el refresco periódico de todas las hojas configuradas."""
+        if self._scheduler is None:
+            self._scheduler = RefreshScheduler(
+                self,
+                min_interval=getattr(Config, "SHEETS_PREFETCH_MIN_INTERVAL", 30),
+                max_interval=getattr(Config, "SHEETS_PREFETCH_MAX_INTERVAL", 900),
+                business_hours=getattr(Config, "SHEETS_BUSINESS_HOURS", (8, 20)),
+            )
+        self._scheduler.start()
+
+    def stop_scheduler(self):
+        if self._scheduler:
+            self._scheduler.stop()
+
+    def refresh_stats(self):
+        """
+        Métricas por hoja del scheduler (último refresh, duración, intervalo),
+        por nombre "libro/hoja" para poder servirlas como JSON.
+        """
+        if not self._scheduler:
+            return {}
+        aliases = self.source_aliases()
+        return {"/".join((aliases.get(key) or [key])[0]): st
+                for key, st in self._scheduler.stats().items()}
+
+    def sheets_status(self):
+        """
+        Estado de conexión para avisos en plantillas:
+          {"degraded": bool, "age": segundos del dato más viejo servido,
+           "sources": [{"name", "state", "age", "error"}, ...]}
+        Solo aparecen las hojas cuyo libro tiene el circuito abierto o a prueba.
+        """
+        open_books = {sid: b.snapshot() for sid, b in list(self._breakers.items())
+                      if b.state != CLOSED}
+        if not open_books:
+            return {"degraded": False, "age": 0, "sources": []}
+        aliases = self.source_aliases()
+        sources = []
+        for key, snap in list(self._snapshots.items()):
+            st = open_books.get(key[0])
+            if st is None:
+                continue
+            names = aliases.get(key) or [(key[0], key[1])]
+            # fetched_at = 0: vencido a propósito (_mark_stale), antigüedad desconocida
+            sources.append({"name": "/".join(names[0]), "state": st["state"],
+                            "age": snap.age if snap.fetched_at else None,
+                            "error": st["last_error"]})
+        return {"degraded": True,
+                "age": max((s["age"] for s in sources if s["age"] is not None), default=0),
+                "sources": sources}
+
+    # ----------------------------------------------------------
+    # Lectura / escritura
+    # ----------------------------------------------------------
     @retry_on_quota
     def get_all_records(self, book_name, worksheet_name):
-        ws = self.get_worksheet(book_name, worksheet_name)
-        if not ws:
+        snap = self._get_snapshot(book_name, worksheet_name)
+        if not snap:
             return []
-        return self._records_from_ws(ws)
+        return [r for layer in self._layers(snap) for r in layer.records()]
 
     @retry_on_quota
     def find_record(self, book_name, worksheet_name, column, value,
                     case_insensitive=True, strip=True):
         """Busca el primer registro que cumpla column == value."""
-        records = self.get_all_records(book_name, worksheet_name)
+        snap = self._get_snapshot(book_name, worksheet_name)
+        if not snap:
+            return None
         if strip:
             value = (value or "").strip()
-        for rec in records:
-            v = rec.get(column)
-            if v is None:
-                continue
-            v_cmp = v.strip() if (strip and isinstance(v, str)) else v
-            if case_insensitive and isinstance(v_cmp, str) and isinstance(value, str):
-                if v_cmp.lower() == value.lower():
-                    return rec
+        for layer in self._layers(snap):
+            pos = {h: i for i, h in enumerate(layer.headers)}.get(column)
+            if pos is None:
+                return None
+            by_str, by_other = self._value_index(layer, pos, case_insensitive, strip)
+            if isinstance(value, str):
+                i = by_str.get(value.lower() if case_insensitive else value)
             else:
-                if v_cmp == value:
-                    return rec
+                try:
+                    i = by_other.get(value)
+                except TypeError:  # valor no hasheable
+                    i = None
+            if i is not None:
+                return layer.record(i)
         return None
 
     @retry_on_quota
-    def add_record(self, book_name, worksheet_name, data):
-        """Agrega una fila al final. `data` es lista en el orden de columnas."""
-        ws = self.get_worksheet(book_name, worksheet_name)
-        if not ws:
+    def find_by_digits(self, book_name, worksheet_name, column, query):
+        """
+        Registros cuya columna `column`, reducida a dígitos, es igual a los
+        dígitos de `query` o los contiene (DNI, celular). Usa un índice por
+        snapshot en lugar de recorrer la hoja.
+        """
+        snap = self._get_snapshot(book_name, worksheet_name)
+        if not snap:
+            return []
+        q = only_digits(query)
+        out = []
+        for layer in self._layers(snap):
+            # Con encabezados repetidos gana el último, como en records()
+            pos = {h: i for i, h in enumerate(layer.headers)}.get(column)
+            if pos is None:
+                ids = range(len(layer)) if not q else ()
+            else:
+                index = layer.derived(
+                    f"digits:{pos}",
+                    lambda snap: DigitIndex(self._map_column(snap, pos, only_digits)),
+                )
+                ids = index.lookup(q)
+            out.extend(layer.record(i) for i in ids)
+        return out
+
+    @retry_on_quota
+    def add_record(self, book_name, worksheet_name, data, deferred=None):
+        """
+        Agrega una fila al final. `data` es lista en el orden de columnas.
+        Con deferred (por defecto Config.SHEETS_WRITE_BEHIND) la fila se encola
+        y se devuelve un ticket (ver write_status) en lugar de True.
+        """
+        if deferred is None:
+            deferred = getattr(Config, "SHEETS_WRITE_BEHIND", False)
+        if deferred:
+            src = self._resolve_source(book_name, worksheet_name)
+            if not src:
+                return False
+            key = (src[0], src[1])
+            try:
+                ticket = self._write_queue().enqueue(key, data)
+            except OSError as e:
+                _log.warning("No se pudo encolar el registro, se escribe en línea: %s", e)
+            else:
+                # Visible de inmediato en las lecturas de este proceso
+                self._add_provisional(key, [(ticket, data)], written_at=None)
+                return ticket
+
+        src = self._resolve_source(book_name, worksheet_name)
+        if not src:
             return False
         try:
-            ws.append_row(data, value_input_option="USER_ENTERED")
+            # Con el circuito del libro abierto falla al instante (CircuitOpen)
+            self._breaker(src[0]).call(self._backend().append_rows, src[0], src[1], [data])
+            # La próxima lectura debe ver la fila recién agregada: se agrega como
+            # provisional (sin tocar el snapshot) y este se refresca en segundo plano
+            key = (src[0], src[1])
+            self._add_provisional(key, [(uuid.uuid4().hex, data)], written_at=time.time())
+            self._mark_stale(key)
             return True
         except Exception as e:
             _log.warning("Error al agregar registro: %s", e)
             return False
 
+    def _write_queue(self):
+        """Cola de escritura diferida del proceso (se crea y arranca al primer uso)."""
+        if self._writes is None or self._writes_pid != os.getpid():
+            with self._snap_lock:
+                if self._writes is None or self._writes_pid != os.getpid():
+                    self._writes = WriteQueue(
+                        self,
+                        getattr(Config, "SHEETS_WRITE_SPOOL", "instance/sheets_spool"),
+                        interval=getattr(Config, "SHEETS_WRITE_INTERVAL", 2),
+                        max_attempts=getattr(Config, "SHEETS_WRITE_MAX_ATTEMPTS", 8),
+                        max_backoff=getattr(Config, "SHEETS_WRITE_MAX_BACKOFF", 300),
+                        # No llegaron a Google: esperan sin gastar intentos
+                        transient=(CircuitOpen, QuotaWaitExceeded),
+                    )
+                    self._writes_pid = os.getpid()
+        self._writes.start()
+        return self._writes
+
+    def start_write_queue(self):
+        """Crea la cola diferida ya (al arrancar) para adoptar filas pendientes del spool."""
+        if getattr(Config, "SHEETS_WRITE_BEHIND", False):
+            self._write_queue()
+
+    def _close_writes(self):
+        writes = self._writes
+        if writes is not None and self._writes_pid == os.getpid():
+            writes.stop(flush=True)
+            writes.release()
+
+    def write_status(self, ticket):
+        """
+        Estado de una escritura diferida: {"state": "pending"|"written"|"failed", ...} o
+        None. Si el ticket es de otro worker se responde desde el spool compartido.
+        """
+        if self._writes is not None:
+            return self._writes.status(ticket)
+        return spool_status(getattr(Config, "SHEETS_WRITE_SPOOL", "instance/sheets_spool"), ticket)
+
+    def flush_writes(self):
+        """Escribe ya las filas encoladas (p. ej. antes de apagar el worker)."""
+        if self._writes is not None:
+            self._writes.flush()
+
+    @retry_on_quota
+    def _append_rows(self, key, rows):
+        """Usado por WriteQueue: varias filas en un solo append_rows."""
+        self._breaker(key[0]).call(self._backend().append_rows, key[0], key[1], rows)
+
+    def _rows_written(self, key, tickets):
+        """Usado por WriteQueue tras escribir: las filas provisionales ya están en la hoja."""
+        now = time.time()
+        done = set(tickets)
+        with self._snap_lock:
+            for entry in self._provisional.get(key, ()):
+                if entry["id"] in done:
+                    entry["written_at"] = now
+        self._mark_stale(key)
+
+    def _rows_failed(self, key, tickets):
+        """Usado por WriteQueue al descartar filas: dejan de mostrarse como provisionales."""
+        dropped = set(tickets)
+        with self._snap_lock:
+            entries = [e for e in self._provisional.get(key, ()) if e["id"] not in dropped]
+            if entries:
+                self._provisional[key] = entries
+            else:
+                self._provisional.pop(key, None)
+
+    # ----------------------------------------------------------
+    # Lectura de lo escrito (filas provisionales)
+    # ----------------------------------------------------------
+    def _add_provisional(self, key, rows, written_at=None):
+        """
+        Registra filas [(id, valores)] escritas (o encoladas, written_at=None)
+        por este proceso para que las lecturas las vean sin esperar a que una
+        descarga las traiga. El snapshot base y sus índices no se tocan.
+        """
+        added = [{"id": entry_id, "row": list(data), "written_at": written_at}
+                 for entry_id, data in rows]
+        with self._snap_lock:
+            # Lista nueva en cada cambio: _overlay la usa como marca de validez
+            self._provisional[key] = self._provisional.get(key, []) + added
+
+    def _overlay(self, snap, entries):
+        """
+        Snapshot chico con las filas provisionales `entries` de la hoja de
+        `snap` (mismos encabezados y versión). Se arma una vez por par
+        (snapshot base, filas provisionales); los lectores lo combinan con el
+        base (ver _layers).
+        """
+        cached = self._overlays.get(snap.key)
+        if cached is not None and cached[0] is snap and cached[1] is entries:
+            return cached[2]
+        overlay = SheetSnapshot(snap.key, snap.version, snap.headers,
+                                [self._fit(e["row"], snap.headers) for e in entries], snap.fetched_at)
+        self._overlays[snap.key] = (snap, entries, overlay)
+        return overlay
+
+    def _layers(self, snap):
+        """
+        [snapshot base] o [base, provisionales], en orden de hoja. Si mientras
+        tanto se instaló otra versión se usa esa: las filas provisionales
+        vigentes corresponden a ella.
+        """
+        with self._snap_lock:
+            snap = self._snapshots.get(snap.key) or snap
+            entries = self._provisional.get(snap.key)
+        if not entries:
+            self._overlays.pop(snap.key, None)
+            return [snap]
+        return [snap, self._overlay(snap, entries)]
+
+    @staticmethod
+    def _recent_rows(snap, n=50):
+        """Las últimas `n` filas de `snap` como tuplas (ahí aparecen las filas propias)."""
+        return {tuple(snap.table.row(i)) for i in range(max(0, len(snap) - n), len(snap))}
+
+    def _prune_provisional(self, snap, recent, started_at):
+        """
+        Olvida las filas provisionales que ya trae `snap` (descarga iniciada en
+        `started_at`, `recent` = sus últimas filas): las escritas antes de
+        empezar la descarga y las que aparecen entre sus últimas filas. Se
+        llama con _snap_lock tomado.
+        """
+        entries = self._provisional.get(snap.key)
+        if not entries:
+            return
+        keep = []
+        for entry in entries:
+            written_at = entry["written_at"]
+            if written_at is not None and written_at < started_at:
+                continue
+            if written_at is not None and tuple(self._fit(entry["row"], snap.headers)) in recent:
+                continue
+            keep.append(entry)
+        if len(keep) == len(entries):
+            return
+        if keep:
+            self._provisional[snap.key] = keep
+        else:
+            self._provisional.pop(snap.key, None)
+
+    @staticmethod
+    def _fit(row, headers):
+        """Rellena/recorta una fila al ancho de los encabezados (como normalize_values)."""
+        row = list(row)[:len(headers)]
+        return row + [""] * (len(headers) - len(row))
+
+    def _mark_stale(self, key):
+        """Fuerza un refresco en la próxima lectura (en segundo plano) y avisa a otros workers."""
+        snap = self._snapshots.get(key)
+        if snap is not None:
+            snap.fetched_at = 0
+        store = self._shared_store()
+        if store is not None:
+            try:
+                store.expire(key)
+            except sqlite3.Error as e:
+                _log.debug("No se pudo vencer '%s' en el almacén compartido: %s", key[1], e)
+
     def clear_cache(self):
         self._sheet_cache.clear()
         self._ws_cache.clear()
+        with self._snap_lock:
+            self._snapshots.clear()
+            self._overlays.clear()
+        self._schema_cache.clear()
+        store = self._shared_store()
+        if store is not None:
+            try:
+                store.clear()
+            except sqlite3.Error as e:
+                _log.debug("No se pudo limpiar el almacén compartido: %s", e)
         _log.info("Cache de Google Sheets limpiado")
 
     # ----------------------------------------------------------
@@ -266,62 +1408,25 @@ class GoogleSheetService:
           - datetime/date
           - str en %d/%m/%Y, %Y-%m-%d, %d-%m-%Y, %m/%d/%Y, %Y/%m/%d, ISO
           - serial de Sheets/Excel (float/int; base 1899-12-30) o string numérico
+        (ver services/date_engine.py)
         """
-        if isinstance(v, datetime):
-            return v.date()
-        if isinstance(v, date):
-            return v
-        if v is None or v == "":
-            return None
-
-        # Serial number directo (evita confundir "2025")
-        if isinstance(v, (int, float)):
-            n = float(v)
-            if 20000 <= n <= 60000:  # rango aprox 1954–2064
-                base = date(1899, 12, 30)
-                return base + timedelta(days=n)
-
-        s = str(v).strip()
-        # string numérico como serial
-        if s.replace(".", "", 1).isdigit():
-            try:
-                n = float(s)
-                if 20000 <= n <= 60000:
-                    base = date(1899, 12, 30)
-                    return base + timedelta(days=n)
-            except Exception:
-                pass
-
-        # formatos comunes
-        for fmt in ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%m/%d/%Y", "%Y/%m/%d"):
-            try:
-                return datetime.strptime(s, fmt).date()
-            except ValueError:
-                continue
-
-        # Texto largo: "24 de marzo del 2025"
-        try:
-            import re
-            meses = {
-                "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6,
-                "julio": 7, "agosto": 8, "setiembre": 9, "septiembre": 9,
-                "octubre": 10, "noviembre": 11, "diciembre": 12
-            }
-            m = re.match(r"(\d{1,2})\s+de\s+(\w+)(?:\s+del\s+(\d{4}))?", s, re.IGNORECASE)
-            if m:
-                dia = int(m.group(1))
-                mes = meses.get(m.group(2).lower())
-                ano = int(m.group(3)) if m.group(3) else datetime.now().year
-                if mes:
-                    return date(ano, mes, dia)
-        except Exception:
-            pass
+        return parse_date(v)
 
-        # ISO parcial
-        try:
-            return datetime.fromisoformat(s.split()[0]).date()
-        except Exception:
-            return None
+    @staticmethod
+    def _date_column(snap, pos):
+        """
+        Fechas de la columna `pos` parseadas una vez por snapshot: se detecta el
+        formato dominante y cada valor distinto se parsea una sola vez.
+        """
+        def build(snap):
+            if pos is None:
+                return [None] * len(snap)
+            col = snap.table.columns[pos]
+            if isinstance(col, DictColumn):
+                parsed = parse_date_column(col.values)
+                return [parsed[c] for c in col.codes]
+            return parse_date_column(col.tolist())
+        return snap.derived(f"dates:{pos}", build)
 
     @staticmethod
     def _norm_code_loose(v: str) -> str:
@@ -381,44 +1486,295 @@ class GoogleSheetService:
         except Exception:
             return None
 
+    # ----------------------------------------------------------
+    # Modelos tipados por snapshot (se construyen una sola vez)
+    # ----------------------------------------------------------
+    @staticmethod
+    def _schema_id(headers):
+        """Identificador corto del esquema (lista de encabezados) de una hoja."""
+        return format(zlib.crc32("\x1f".join(map(str, headers)).encode("utf-8")), "08x")
+
+    def _resolve_schema(self, headers, spec_name):
+        """
+        {columna lógica: (posición, encabezado)} de COLUMN_SPECS[spec_name] para
+        unos encabezados. Se calcula una vez por esquema: los snapshots nuevos con
+        los mismos encabezados reutilizan el resultado.
+        """
+        cache_key = (tuple(headers), spec_name)
+        resolved = self._schema_cache.get(cache_key)
+        if resolved is None:
+            # {encabezado: índice}; si hay repetidos gana el último, como en dict(zip)
+            pos = {h: i for i, h in enumerate(headers)}
+            key_index = self._index_keys(pos)
+            resolved = {}
+            for logical, (exact, contains) in COLUMN_SPECS[spec_name].items():
+                k = self._find_key(key_index, exact, contains)
+                resolved[logical] = (pos[k], k) if k else (None, None)
+            self._schema_cache[cache_key] = resolved
+        return resolved
+
+    def _columns(self, snap, spec_name):
+        """{columna lógica: posición o None} de COLUMN_SPECS[spec_name] en el snapshot."""
+        def build(snap):
+            return {logical: p for logical, (p, _h) in self._resolve_schema(snap.headers, spec_name).items()}
+        return snap.derived(f"cols:{spec_name}", build)
+
+    def column_map(self, book_name, worksheet_name, spec_name=None):
+        """
+        Qué encabezado físico usa cada columna lógica de una hoja:
+        {"schema": id del esquema, "spec": nombre, "columns": {'personal': 'PERSONAL', ...}}.
+        """
+        spec_name = spec_name or BOOK_SPECS.get(book_name)
+        snap = self._get_snapshot(book_name, worksheet_name)
+        if not snap or spec_name not in COLUMN_SPECS:
+            return {}
+        return {
+            "schema": self._schema_id(snap.headers),
+            "spec": spec_name,
+            "columns": {logical: h for logical, (_p, h) in self._resolve_schema(snap.headers, spec_name).items()},
+        }
+
+    @staticmethod
+    def _map_column(snap, pos, fn=None, default=""):
+        """
+        Valores de la columna `pos` (o `default` si no existe), aplicando fn.
+        En columnas con diccionario fn se evalúa una sola vez por valor único.
+        """
+        table = snap.table
+        if pos is None:
+            return [default] * table.nrows
+        col = table.columns[pos]
+        if fn is None:
+            return col.tolist()
+        if isinstance(col, DictColumn):
+            mapped = [fn(v) for v in col.values]
+            return [mapped[c] for c in col.codes]
+        return [fn(v) for v in col.tolist()]
+
+    @staticmethod
+    def _rows_where(snap, pos, pred):
+        """
+        Filas (en orden) cuyo valor en la columna `pos` cumple pred. Con
+        diccionario, pred se evalúa por valor único y se comparan códigos enteros.
+        """
+        table = snap.table
+        if pos is None:
+            return list(range(table.nrows)) if pred("") else []
+        col = table.columns[pos]
+        if isinstance(col, DictColumn):
+            return col.rows_with_codes(col.codes_where(pred))
+        return [i for i, v in enumerate(col.tolist()) if pred(v)]
+
+    def _build_asesores(self, snap):
+        cols = self._columns(snap, "asesores")
+
+        def low(v):
+            return str(v).strip().lower()
+
+        def codigo(v):
+            return str(v).strip() if v is not None else ""
+
+        def comision(pct):
+            if pct is None or pct == "":
+                return None
+            try:
+                return float(str(pct).replace("%", "").strip()) / 100.0
+            except Exception:
+                return None
+
+        return [Asesor(*a) for a in zip(
+            self._map_column(snap, cols["email"], low),
+            self._map_column(snap, cols["username"], low),
+            self._map_column(snap, cols["nombre"], low),
+            self._map_column(snap, cols["codigo"], codigo),
+            self._map_column(snap, cols["comision"], comision, default=None),
+        )]
+
+    def _build_ventas(self, snap):
+        """Ventas de la hoja dashboard; None si no hay columna PERSONAL."""
+        cols = self._columns(snap, "ventas")
+        if cols["personal"] is None:
+            _log.debug("No se encontró columna PERSONAL en dashboard")
+            return None
+        return [Venta(*v) for v in zip(
+            self._map_column(snap, cols["personal"], self._extract_code),
+            self._date_column(snap, cols["fecha"]),
+            self._map_column(snap, cols["cliente"]),
+            self._map_column(snap, cols["dni"]),
+            self._map_column(snap, cols["celular"]),
+            self._map_column(snap, cols["producto"]),
+            self._map_column(snap, cols["operacion"]),
+            self._map_column(snap, cols["monto"], self._safe_float, default=0.0),
+        )]
+
+    def _build_cobranzas(self, snap):
+        """Ventas de QUERYS como cobranzas; None si faltan PERSONAL o los montos."""
+        cols = self._columns(snap, "cobranzas")
+        if cols["personal"] is None or cols["monto_total"] is None or cols["monto_depositado"] is None:
+            return None
+        fechas = self._date_column(snap, cols["fecha"])
+        return [Cobranza(*c) for c in zip(
+            self._map_column(snap, cols["personal"], self._extract_code),
+            fechas,
+            # FECHA DE COBRO = FECHA DE LA VENTA + 30 días
+            [f + timedelta(days=30) if f else None for f in fechas],
+            self._map_column(snap, cols["cliente"]),
+            self._map_column(snap, cols["dni"]),
+            self._map_column(snap, cols["celular"]),
+            self._map_column(snap, cols["correo"]),
+            self._map_column(snap, cols["monto_total"], self._safe_float),
+            self._map_column(snap, cols["monto_depositado"], self._safe_float),
+            self._map_column(snap, cols["especialidad"]),
+            self._map_column(snap, cols["observaciones"]),
+        )]
+
+    def _build_menciones(self, snap):
+        cols = self._columns(snap, "menciones")
+
+        def text(v):
+            return str(v).strip()
+
+        def parse_num(v):
+            try:
+                return float(str(v).replace(",", "."))
+            except Exception:
+                return None
+
+        return [Mencion(*m) for m in zip(
+            self._map_column(snap, cols["nro"], text),
+            self._map_column(snap, cols["especialidad"], text),
+            self._map_column(snap, cols["p_certificado"], text),
+            self._map_column(snap, cols["mencion"], text),
+            self._map_column(snap, cols["horas"], parse_num, default=None),
+            self._date_column(snap, cols["f_inicio"]),
+            self._date_column(snap, cols["f_termino"]),
+            self._date_column(snap, cols["f_emision"]),
+        )]
+
+    # ----------------------------------------------------------
+    # Índices por snapshot
+    # ----------------------------------------------------------
+    @staticmethod
+    def _code_index(snap, name, builder):
+        """
+        {código PERSONAL: array de filas (en orden de hoja)} sobre los modelos
+        `name`. Se arma una vez por snapshot; las consultas por asesor solo
+        recorren sus propias filas.
+        """
+        def build(snap):
+            index = {}
+            for i, m in enumerate(snap.derived(name, builder) or ()):
+                ids = index.get(m.codigo)
+                if ids is None:
+                    ids = index[m.codigo] = array("l")
+                ids.append(i)
+            return index
+        return snap.derived(f"by_code:{name}", build)
+
+    def _build_mention_index(self, snap):
+        """
+        Índices de MENCIONES: texto libre (NRO, ESPECIALIDAD, MENCIÓN,
+        P. CERTIFICADO sin tildes) y rangos de HORAS, F. INICIO y F. EMISIÓN.
+        """
+        menciones = snap.derived("menciones", self._build_menciones)
+        return {
+            "texto": TextIndex([
+                fold(" ".join([m.nro, m.especialidad, m.mencion, m.p_certificado])) for m in menciones
+            ]),
+            "horas": RangeIndex([m.horas for m in menciones]),
+            "f_inicio": RangeIndex([m.f_inicio for m in menciones]),
+            "f_emision": RangeIndex([m.f_emision for m in menciones]),
+        }
+
+    def _build_mention_facets(self, snap):
+        menciones = snap.derived("menciones", self._build_menciones)
+        return {
+            "especialidad": facet_counts(m.especialidad for m in menciones),
+            "p_certificado": facet_counts(m.p_certificado for m in menciones),
+        }
+
+    @staticmethod
+    def _value_index(snap, pos, case_insensitive, strip):
+        """
+        Índice de la columna `pos` para find_record: ({texto normalizado: fila},
+        {otro valor: fila}), quedándose con la primera fila de cada valor.
+        """
+        def build(snap):
+            by_str, by_other = {}, {}
+            col = snap.table.columns[pos]
+            for i, v in enumerate(col.tolist()):
+                if v is None:
+                    continue
+                if isinstance(v, str):
+                    if strip:
+                        v = v.strip()
+                    by_str.setdefault(v.lower() if case_insensitive else v, i)
+                else:
+                    by_other.setdefault(v, i)
+            return by_str, by_other
+        return snap.derived(f"values:{pos}:{int(case_insensitive)}:{int(strip)}", build)
+
+    def _code_date_index(self, snap, name, builder, attr):
+        """
+        {código: (ordinales, filas)} con las filas de cada código ordenadas por la
+        fecha `attr` del modelo (las filas sin fecha quedan fuera). Combina el
+        índice por código con uno ordenado por fecha para buscar rangos con bisect.
+        """
+        def build(snap):
+            models = snap.derived(name, builder) or ()
+            index = {}
+            for code, ids in self._code_index(snap, name, builder).items():
+                pairs = []
+                for i in ids:
+                    d = getattr(models[i], attr)
+                    if d:
+                        pairs.append((d.toordinal(), i))
+                pairs.sort()
+                index[code] = (array("l", [o for o, _ in pairs]), array("l", [i for _, i in pairs]))
+            return index
+        return snap.derived(f"by_code_date:{name}:{attr}", build)
+
+    @staticmethod
+    def _ids_in_range(entry, d_start, d_end):
+        """Filas de una entrada de _code_date_index con fecha en [d_start, d_end], por fecha asc."""
+        if not entry:
+            return ()
+        ords, ids = entry
+        lo = bisect_left(ords, d_start.toordinal())
+        hi = bisect_right(ords, d_end.toordinal())
+        return ids[lo:hi]
+
     # ----------------------------------------------------------
     # CREDENCIALES: Código y Comisión
     # ----------------------------------------------------------
+    def _find_asesor(self, username: str, config):
+        snap = self._get_snapshot("credenciales", "usuarios", config["SHEETS"])
+        if not snap:
+            return None
+        target = (username or "").strip().lower()
+        if not target:
+            return None
+        for layer in self._layers(snap):
+            i = layer.derived("asesores_by_key", self._build_asesor_index).get(target)
+            if i is not None:
+                return layer.derived("asesores", self._build_asesores)[i]
+        return None
+
+    def _build_asesor_index(self, snap):
+        """{email/username/nombre normalizado: primer asesor que lo tiene}."""
+        index = {}
+        for i, a in enumerate(snap.derived("asesores", self._build_asesores)):
+            for key in (a.email, a.username, a.nombre):
+                if key:
+                    index.setdefault(key, i)
+        return index
+
     def get_user_code(self, username: str, config) -> str:
         """Devuelve Código desde la hoja de credenciales."""
         try:
-            cred_cfg = config["SHEETS"]["credenciales"]
-            sh = self.get_sheet_by_key(cred_cfg["id"])
-            if not sh:
-                return ""
-            ws_title = cred_cfg["worksheets"]["usuarios"]
-            ws = self._ws_cache.get((cred_cfg["id"], ws_title))
-            if not ws:
-                ws = sh.worksheet(ws_title)
-                self._ws_cache[(cred_cfg["id"], ws_title)] = ws
-
-            rows = self._records_from_ws(ws)
-            if not rows:
-                return ""
-
-            key_index = self._index_keys(rows[0])
-            k_email = self._find_key(key_index, ["Email"])
-            k_user = self._find_key(key_index, ["Username"])
-            k_name = self._find_key(key_index, ["Nombres y Apellidos", "Nombres y apellidos"])
-            k_codigo = self._find_key(key_index, ["Codigo", "Código", "codigo", "code"])
-            if not k_codigo:
-                return ""
-
-            target = (username or "").strip().lower()
-            for r in rows:
-                cand = [
-                    str(r.get(k_email, "")).strip().lower() if k_email else "",
-                    str(r.get(k_user, "")).strip().lower() if k_user else "",
-                    str(r.get(k_name, "")).strip().lower() if k_name else "",
-                ]
-                if target and target in cand:
-                    val = r.get(k_codigo, "")
-                    return str(val).strip() if val is not None else ""
+            asesor = self._find_asesor(username, config)
+            if asesor:
+                return asesor.codigo
         except Exception as e:
             _log.debug("get_user_code error: %s", e, exc_info=False)
         return ""
@@ -426,43 +1782,9 @@ class GoogleSheetService:
     def get_user_commission_pct(self, username: str, config) -> float:
         """Lee 'Comisión' desde credenciales; cae a DEFAULT_COMMISSION_PCT si no hay dato."""
         try:
-            cred_cfg = config["SHEETS"]["credenciales"]
-            sh = self.get_sheet_by_key(cred_cfg["id"])
-            if not sh:
-                return config.get("DEFAULT_COMMISSION_PCT", 0.10)
-            ws_title = cred_cfg["worksheets"]["usuarios"]
-            ws = self._ws_cache.get((cred_cfg["id"], ws_title))
-            if not ws:
-                ws = sh.worksheet(ws_title)
-                self._ws_cache[(cred_cfg["id"], ws_title)] = ws
-
-            rows = self._records_from_ws(ws)
-            if not rows:
-                return config.get("DEFAULT_COMMISSION_PCT", 0.10)
-
-            key_index = self._index_keys(rows[0])
-            k_email = self._find_key(key_index, ["Email"])
-            k_user = self._find_key(key_index, ["Username"])
-            k_name = self._find_key(key_index, ["Nombres y Apellidos", "Nombres y apellidos"])
-            k_comis = self._find_key(key_index, ["Comisión", "Comision", "commission", "pct"])
-
-            target = (username or "").strip().lower()
-            for r in rows:
-                cand = [
-                    str(r.get(k_email, "")).strip().lower() if k_email else "",
-                    str(r.get(k_user, "")).strip().lower() if k_user else "",
-                    str(r.get(k_name, "")).strip().lower() if k_name else "",
-                ]
-                if target and target in cand:
-                    if not k_comis:
-                        break
-                    pct = r.get(k_comis)
-                    if pct is None or pct == "":
-                        break
-                    try:
-                        return float(str(pct).replace("%", "").strip()) / 100.0
-                    except Exception:
-                        break
+            asesor = self._find_asesor(username, config)
+            if asesor and asesor.comision is not None:
+                return asesor.comision
         except Exception:
             pass
         return config.get("DEFAULT_COMMISSION_PCT", 0.10)
@@ -470,6 +1792,53 @@ class GoogleSheetService:
     # ----------------------------------------------------------
     # DASHBOARD: ventas por Código (PERSONAL)
     # ----------------------------------------------------------
+    def _mention_ids(self, snap, q=None, especialidad=None, mencion=None,
+                     p_certificado=None, horas_min=None, horas_max=None,
+                     f_ini_desde=None, f_ini_hasta=None,
+                     f_emis_desde=None, f_emis_hasta=None):
+        """Filas de MENCIONES (en orden de hoja) que cumplen los filtros de search_mentions."""
+        q_norm = (q or "").strip().lower()
+        esp_norm = especialidad.strip().lower() if especialidad else None
+        menc_norm = mencion.strip().lower() if mencion else None
+        p_cert_norm = (p_certificado or "").strip().lower() if p_certificado else None
+
+        # Filtros de igualdad/contiene sobre columnas con diccionario:
+        # se evalúan por valor único y luego se comparan códigos enteros
+        cols = self._columns(snap, "menciones")
+        col_filters = []
+        if esp_norm is not None:
+            col_filters.append((cols["especialidad"], lambda v: str(v).strip().lower() == esp_norm))
+        if menc_norm is not None:
+            col_filters.append((cols["mencion"], lambda v: str(v).strip().lower() == menc_norm))
+        if p_cert_norm:
+            col_filters.append((cols["p_certificado"], lambda v: p_cert_norm in str(v).strip().lower()))
+        # Cada filtro aporta sus filas candidatas (de un índice); se intersectan
+        # empezando por la lista más corta
+        idx = snap.derived("menciones_idx", self._build_mention_index)
+        candidates = [self._rows_where(snap, pos, pred) for pos, pred in col_filters]
+        if q_norm:
+            candidates.append(idx["texto"].lookup(fold(q_norm)))
+        if horas_min is not None or horas_max is not None:
+            candidates.append(idx["horas"].between(
+                float(horas_min) if horas_min is not None else None,
+                float(horas_max) if horas_max is not None else None,
+            ))
+        if f_ini_desde or f_ini_hasta:
+            candidates.append(idx["f_inicio"].between(f_ini_desde or None, f_ini_hasta or None))
+        if f_emis_desde or f_emis_hasta:
+            candidates.append(idx["f_emision"].between(f_emis_desde or None, f_emis_hasta or None))
+
+        if not candidates:
+            return range(len(snap))
+        candidates.sort(key=len)
+        ids = candidates[0]
+        for other in candidates[1:]:
+            if not ids:
+                break
+            allowed = set(other)
+            ids = [i for i in ids if i in allowed]
+        return sorted(ids)
+
     def search_mentions(self, config, q=None, especialidad=None, mencion=None,
                         p_certificado=None, horas_min=None, horas_max=None,
                         f_ini_desde=None, f_ini_hasta=None,
@@ -477,254 +1846,182 @@ class GoogleSheetService:
                         limit=200):
         """
         Lee la hoja MENCIONES y filtra por los parámetros indicados.
-        - q: texto en NRO, ESPECIALIDAD, MENCIÓN, P. CERTIFICADO
+        - q: texto en NRO, ESPECIALIDAD, MENCIÓN, P. CERTIFICADO (sin distinguir tildes)
         - horas: se devuelve como entero si es un número entero
+        - limit: se toman las primeras `limit` coincidencias (orden de hoja) y se
+          ordenan por fecha desc; para paginar usar search_mentions_page
         """
         empty = []
         try:
-            conf = config['SHEETS']['menciones']
-            sh = self.get_sheet_by_key(conf['id'])
-            if not sh:
-                return empty
-            ws_title = conf['worksheets']['registro']
-            ws = self._ws_cache.get((conf['id'], ws_title))
-            if not ws:
-                ws = sh.worksheet(ws_title)
-                self._ws_cache[(conf['id'], ws_title)] = ws
-            rows = self._records_from_ws(ws)
-            if not rows:
+            snap = self._get_snapshot('menciones', 'registro', config['SHEETS'])
+            if not snap:
                 return empty
 
-            # Mapear encabezados
-            key_index = self._index_keys(rows[0])
-            k_nro   = self._find_key(key_index, ["NRO"], ["nro","numero","n°"])
-            k_esp   = self._find_key(key_index, ["ESPECIALIDAD"], ["especialidad"])
-            k_pcert = self._find_key(key_index, ["P. CERTIFICADO","P CERTIFICADO","PROCESO CERTIFICADO"], ["cert"])
-            k_menc  = self._find_key(key_index, ["MENCIÓN","MENCION"], ["mencion"])
-            k_horas = self._find_key(key_index, ["HORAS"], ["horas"])
-            k_fini  = self._find_key(key_index, ["F. INICIO","FECHA INICIO"], ["inicio"])
-            k_fter  = self._find_key(key_index, ["F. TÉRMINO","F. TERMINO","FECHA TERMINO","FECHA TÉRMINO"], ["termino","término"])
-            k_femis = self._find_key(key_index, ["F. EMISIÓN","F. EMISION","FECHA EMISION","FECHA EMISIÓN"], ["emision","emisión"])
-
-            q_norm = (q or "").strip().lower()
-            p_cert_norm = (p_certificado or "").strip().lower() if p_certificado else None
-
-            def parse_num(v):
-                try:
-                    return float(str(v).replace(",", "."))
-                except Exception:
-                    return None
-
             out = []
-            for r in rows:
-                # Compose record
-                nro   = str(r.get(k_nro, "")).strip() if k_nro else ""
-                esp   = str(r.get(k_esp, "")).strip() if k_esp else ""
-                menc_ = str(r.get(k_menc, "")).strip() if k_menc else ""
-                cert_raw = str(r.get(k_pcert, "")).strip() if k_pcert else ""
-                horas = parse_num(r.get(k_horas, "")) if k_horas else None
-                fi = self._parse_date_any(r.get(k_fini, "")) if k_fini else None
-                ft = self._parse_date_any(r.get(k_fter, "")) if k_fter else None
-                fe = self._parse_date_any(r.get(k_femis, "")) if k_femis else None
-
-                # Filtros
-                if q_norm:
-                    blob = " ".join([nro, esp, menc_, cert_raw]).lower()
-                    if q_norm not in blob:
-                        continue
-                if especialidad and esp.lower() != especialidad.strip().lower():
-                    continue
-                if mencion and menc_.lower() != mencion.strip().lower():
-                    continue
-                if p_cert_norm and p_cert_norm not in cert_raw.lower():
-                    continue
-                if horas_min is not None and (horas is None or horas < float(horas_min)):
-                    continue
-                if horas_max is not None and (horas is None or horas > float(horas_max)):
-                    continue
-                if f_ini_desde and (not fi or fi < f_ini_desde):
-                    continue
-                if f_ini_hasta and (not fi or fi > f_ini_hasta):
-                    continue
-                if f_emis_desde and (not fe or fe < f_emis_desde):
-                    continue
-                if f_emis_hasta and (not fe or fe > f_emis_hasta):
+            for layer in self._layers(snap):
+                menciones = layer.derived("menciones", self._build_menciones)
+                if not menciones:
                     continue
-
-                # Formatear horas como entero si es posible
-                horas_display = int(horas) if horas and horas.is_integer() else horas if horas is not None else ""
-                out.append({
-                    "nro": nro,
-                    "especialidad": esp,
-                    "p_certificado": cert_raw,
-                    "mencion": menc_,
-                    "horas": horas_display,
-                    "f_inicio": fi.strftime("%d/%m/%Y") if fi else "",
-                    "f_termino": ft.strftime("%d/%m/%Y") if ft else "",
-                    "f_emision": fe.strftime("%d/%m/%Y") if fe else "",
-                    "_sort": (fi or fe or ft or None)
-                })
-                if limit is not None and len(out) >= int(limit):
-                    break
+                ids = self._mention_ids(
+                    layer, q=q, especialidad=especialidad, mencion=mencion, p_certificado=p_certificado,
+                    horas_min=horas_min, horas_max=horas_max,
+                    f_ini_desde=f_ini_desde, f_ini_hasta=f_ini_hasta,
+                    f_emis_desde=f_emis_desde, f_emis_hasta=f_emis_hasta,
+                )
+                out.extend(menciones[i] for i in ids)
+            if limit is not None:
+                out = out[:int(limit)]
 
             # Ordenar por fecha de inicio (o emisión) desc
-            out.sort(key=lambda x: (x["_sort"] or date(1900, 1, 1)), reverse=True)
-            for x in out:
-                x.pop("_sort", None)
-            return out
+            out.sort(key=lambda x: x.sort_key, reverse=True)
+            return [m.to_view() for m in out]
         except Exception as e:
             _log.error("search_mentions error: %s", e, exc_info=True)
             return empty
 
-    def get_sales_by_code(self, personal_code: str, d_start, d_end, config):
-        """Filtra ventas por PERSONAL == personal_code en el rango [d_start, d_end]."""
-        empty = {"count": 0, "total_monto": 0.0, "ventas": []}
-        if not personal_code:
-            return empty
+    def search_mentions_page(self, config, offset=0, limit=15, sort="fecha", descending=True, **filters):
+        """
+        Una página de search_mentions: mismos filtros, sin límite de coincidencias.
+        Ordena por `sort` (ver MENTION_SORT_KEYS) y solo selecciona las primeras
+        offset + limit filas con un heap, sin ordenar todo el resultado.
+        Devuelve {"total": coincidencias, "rows": [vistas de la página]}.
+        """
+        empty = {"total": 0, "rows": []}
         try:
-            dash_cfg = config["SHEETS"]["dashboard"]
-            sh = self.get_sheet_by_key(dash_cfg["id"])
-            if not sh:
+            snap = self._get_snapshot('menciones', 'registro', config['SHEETS'])
+            if not snap:
                 return empty
-            ws_title = dash_cfg["worksheets"]["registro"]
-            ws = self._ws_cache.get((dash_cfg["id"], ws_title))
-            if not ws:
-                ws = sh.worksheet(ws_title)
-                self._ws_cache[(dash_cfg["id"], ws_title)] = ws
-            rows = self._records_from_ws(ws)
-            if not rows:
+
+            matches = []
+            for layer in self._layers(snap):
+                menciones = layer.derived("menciones", self._build_menciones)
+                if menciones:
+                    matches.extend(menciones[i] for i in self._mention_ids(layer, **filters))
+            offset = max(0, int(offset or 0))
+            page = self._top_k(
+                matches, offset + int(limit),
+                key=MENTION_SORT_KEYS[sort], descending=descending,
+            )[offset:]
+            return {"total": len(matches), "rows": [m.to_view() for m in page]}
+        except Exception as e:
+            _log.error("search_mentions_page error: %s", e, exc_info=True)
+            return empty
+
+    @staticmethod
+    def _top_k(items, k, key, descending=True):
+        """
+        Los primeros k de sorted(items, key=key, reverse=descending), con el
+        mismo desempate (orden original), usando selección parcial.
+        """
+        if k <= 0:
+            return []
+        if descending:
+            return heapq.nlargest(k, items, key=key)
+        return heapq.nsmallest(k, items, key=key)
+
+    def mention_facets(self, config):
+        """
+        Valores de ESPECIALIDAD y P. CERTIFICADO con su número de menciones:
+        {"especialidad": [(valor, n), ...], "p_certificado": [...]}.
+        """
+        empty = {"especialidad": [], "p_certificado": []}
+        try:
+            snap = self._get_snapshot('menciones', 'registro', config['SHEETS'])
+            if not snap:
                 return empty
+            layers = [layer for layer in self._layers(snap)
+                      if layer.derived("menciones", self._build_menciones)]
+            if len(layers) <= 1:
+                return layers[0].derived("menciones_facets", self._build_mention_facets) if layers else empty
+            # Con filas provisionales se suman los conteos de cada capa
+            merged = {}
+            for layer in layers:
+                for name, counts in layer.derived("menciones_facets", self._build_mention_facets).items():
+                    acc = merged.setdefault(name, {})
+                    for value, n in counts:
+                        acc[value] = acc.get(value, 0) + n
+            return {name: sorted(acc.items()) for name, acc in merged.items()}
+        except Exception as e:
+            _log.error("mention_facets error: %s", e, exc_info=True)
+            return empty
 
-            key_index = self._index_keys(rows[0])
-            k_personal = self._find_key(key_index, ["PERSONAL"], ["personal", "asesor", "vendedor"])
-            k_fecha = self._find_key(key_index, ["FECHA DE LA VENTA", "Marca temporal"], ["fecha"])
-            k_monto = self._find_key(key_index, ["MONTO DEPOSITADO"], ["monto", "importe"])
-            k_cliente = self._find_key(key_index, ["NOMBRE COMPLETO DEL CLIENTE", "CLIENTE"], ["cliente"])
-            k_dni = self._find_key(key_index, ["DNI DEL CLIENTE", "DNI"], ["dni"])
-            k_celular = self._find_key(key_index, ["CELULAR DEL CLIENTE", "CELULAR"], ["celular"])
-            k_producto = self._find_key(key_index, ["TIPO DE PRODUCTO", "PRODUCTO"], ["producto"])
-            k_operacion = self._find_key(key_index, ["NUMERO DE OPERACIÓN", "NUMERO DE OPERACION"], ["operacion"])
-            if not k_personal:
-                _log.debug("No se encontró columna PERSONAL en dashboard")
+    def get_sales_by_code(self, personal_code: str, d_start, d_end, config, offset=0, limit=None):
+        """
+        Filtra ventas por PERSONAL == personal_code en el rango [d_start, d_end].
+        count y total_monto cubren todas las ventas; "ventas" trae (por fecha desc)
+        solo la página [offset, offset + limit) si se indica limit.
+        """
+        empty = {"count": 0, "total_monto": 0.0, "ventas": []}
+        if not personal_code:
+            return empty
+        try:
+            snap = self._get_snapshot("dashboard", "registro", config["SHEETS"])
+            if not snap:
                 return empty
 
             target = self._extract_code(personal_code).upper()
-            ventas, total = [], 0.0
-            for r in rows:
-                code_val = self._extract_code(r.get(k_personal, ""))
-                if code_val != target:
-                    continue
-                f = self._parse_date_any(r.get(k_fecha, "")) if k_fecha else None
-                if not f or not (d_start <= f <= d_end):
+            matches, total = [], 0.0
+            for layer in self._layers(snap):
+                ventas_m = layer.derived("ventas", self._build_ventas)
+                if not ventas_m:
                     continue
-                monto = self._safe_float(r.get(k_monto, 0)) if k_monto else 0.0
-                ventas.append({
-                    "fecha": f.strftime("%d/%m/%Y"),
-                    "cliente": r.get(k_cliente, "") if k_cliente else "",
-                    "dni": r.get(k_dni, "") if k_dni else "",
-                    "celular": r.get(k_celular, "") if k_celular else "",
-                    "producto": r.get(k_producto, "") if k_producto else "",
-                    "operacion": r.get(k_operacion, "") if k_operacion else "",
-                    "monto": monto,
-                    "_fecha_dt": f,
-                })
-                total += monto
-            ventas.sort(key=lambda x: x["_fecha_dt"], reverse=True)
-            for v in ventas:
-                v.pop("_fecha_dt", None)
-            return {"count": len(ventas), "total_monto": round(total, 2), "ventas": ventas}
+                index = self._code_date_index(layer, "ventas", self._build_ventas, "fecha")
+                # Orden de hoja para sumar y como desempate del orden por fecha desc
+                for i in sorted(self._ids_in_range(index.get(target), d_start, d_end)):
+                    v = ventas_m[i]
+                    matches.append(v)
+                    total += v.monto
+            if not matches:
+                return empty
+            if limit is None:
+                matches.sort(key=lambda v: v.fecha, reverse=True)
+                page = matches[offset:]
+            else:
+                page = self._top_k(matches, offset + int(limit), key=lambda v: v.fecha)[offset:]
+            ventas = [v.to_view() for v in page]
+            return {"count": len(matches), "total_monto": round(total, 2), "ventas": ventas}
         except Exception as e:
             _log.debug("get_sales_by_code error: %s", e, exc_info=False)
             return empty
 
-    def get_cobranzas_by_code(self, personal_code: str, d_start, d_end, config):
+    def get_cobranzas_by_code(self, personal_code: str, d_start, d_end, config, offset=0, limit=None):
         """
         Filtra cobranzas por PERSONAL == personal_code y donde
         MONTO TOTAL DE LA VENTA != MONTO DEPOSITADO.
         El rango [d_start, d_end] se aplica sobre la FECHA DE COBRO (= FECHA DE LA VENTA + 30 días).
+        Con limit, "cobranzas" trae solo la página [offset, offset + limit).
         Devuelve: {"count": int, "total_monto": float, "cobranzas": list[dict]}
         """
         empty = {"count": 0, "total_monto": 0.0, "cobranzas": []}
         if not personal_code:
             return empty
         try:
-            ventas_cfg = config["SHEETS"]["ventas"]
-            sh = self.get_sheet_by_key(ventas_cfg["id"])
-            if not sh:
-                return empty
-
-            ws_title = ventas_cfg["worksheets"]["registro"]
-            ws = self._ws_cache.get((ventas_cfg["id"], ws_title))
-            if not ws:
-                ws = sh.worksheet(ws_title)
-                self._ws_cache[(ventas_cfg["id"], ws_title)] = ws
-
-            rows = self._records_from_ws(ws)
-            if not rows:
-                return empty
-
-            # Mapear columnas
-            key_index = self._index_keys(rows[0])
-            k_personal = self._find_key(key_index, ["PERSONAL"], ["personal", "asesor"])
-            k_fecha = self._find_key(key_index, ["FECHA DE LA VENTA"], ["fecha"])
-            k_monto_total = self._find_key(key_index, ["MONTO TOTAL DE LA VENTA"], ["monto_total"])
-            k_monto_depositado = self._find_key(key_index, ["MONTO DEPOSITADO"], ["monto_depositado"])
-            k_cliente = self._find_key(key_index, ["NOMBRE COMPLETO DEL CLIENTE"], ["cliente"])
-            k_dni = self._find_key(key_index, ["DNI DEL CLIENTE"], ["dni"])
-            k_celular = self._find_key(key_index, ["CELULAR DEL CLIENTE"], ["celular"])
-            k_correo = self._find_key(key_index, ["CORREO DEL CLIENTE"], ["correo"])
-            k_especialidad = self._find_key(key_index, ["ESPECIALIDAD"], ["especialidad"])
-            k_observaciones = self._find_key(key_index, ["OBSERVACIONES"], ["observaciones"])
-
-            if not k_personal or not k_monto_total or not k_monto_depositado:
+            snap = self._get_snapshot("ventas", "registro", config["SHEETS"])
+            if not snap:
                 return empty
 
             target = self._extract_code(personal_code).upper()
-            cobranzas = []
-            total = 0.0
-
-            for r in rows:
-                code_val = self._extract_code(r.get(k_personal, ""))
-                if code_val != target:
-                    continue
-
-                f_venta = self._parse_date_any(r.get(k_fecha, "")) if k_fecha else None
-                if not f_venta:
+            runs, total = [], 0.0
+            for layer in self._layers(snap):
+                cobranzas_m = layer.derived("cobranzas", self._build_cobranzas)
+                if not cobranzas_m:
                     continue
-
-                # FECHA DE COBRO = FECHA DE LA VENTA + 30 días
-                fecha_de_cobro = f_venta + timedelta(days=30)
-                if not (d_start <= fecha_de_cobro <= d_end):
-                    continue
-
-                # Montos
-                monto_total = self._safe_float(r.get(k_monto_total, 0))
-                monto_depositado = self._safe_float(r.get(k_monto_depositado, 0))
-
+                index = self._code_date_index(layer, "cobranzas", self._build_cobranzas, "fecha_cobro")
+                # Ya vienen por fecha_de_cobro asc (empates en orden de hoja)
                 # Solo incluir si los montos son diferentes
-                if monto_total != monto_depositado:
-                    cobranzas.append({
-                        "fecha": f_venta.strftime("%d/%m/%Y"),
-                        "fecha_de_cobro": fecha_de_cobro.strftime("%d/%m/%Y"),
-                        "cliente": r.get(k_cliente, "") if k_cliente else "",
-                        "dni": r.get(k_dni, "") if k_dni else "",
-                        "celular": r.get(k_celular, "") if k_celular else "",
-                        "correo": r.get(k_correo, "") if k_correo else "",
-                        "monto_total": monto_total,
-                        "monto_depositado": monto_depositado,
-                        "especialidad": r.get(k_especialidad, "") if k_especialidad else "",
-                        "observaciones": r.get(k_observaciones, "") if k_observaciones else "",
-                        "_fecha_cobro_dt": fecha_de_cobro,
-                    })
-                    # Suma actual: monto depositado (si prefieres la diferencia u otro, ajusta aquí)
-                    total += monto_depositado
-
-            # Ordenar por fecha_de_cobro asc
-            cobranzas.sort(key=lambda x: x["_fecha_cobro_dt"])
-            for c in cobranzas:
-                c.pop("_fecha_cobro_dt", None)
-
-            return {"count": len(cobranzas), "total_monto": round(total, 2), "cobranzas": cobranzas}
+                ids = [i for i in self._ids_in_range(index.get(target), d_start, d_end)
+                       if cobranzas_m[i].pendiente]
+                # Suma actual: monto depositado (si prefieres la diferencia u otro, ajusta aquí)
+                for i in sorted(ids):
+                    total += cobranzas_m[i].monto_depositado
+                runs.append([cobranzas_m[i] for i in ids])
+            # Filas provisionales intercaladas por fecha (en empate, después de las de la hoja)
+            matches = runs[0] if len(runs) == 1 else list(heapq.merge(*runs, key=lambda c: c.fecha_cobro))
+            if not matches:
+                return empty
+            end = offset + int(limit) if limit is not None else None
+            cobranzas = [c.to_view() for c in matches[offset:end]]
+            return {"count": len(matches), "total_monto": round(total, 2), "cobranzas": cobranzas}
         except Exception as e:
             _log.debug("get_cobranzas_by_code error: %s", e, exc_info=False)
             return empty
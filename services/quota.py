@@ -0,0 +1,99 @@
+# services/quota.py
+# -*- coding: utf-8 -*-
+"""
+Gobernador de cuota de la API de Sheets (token bucket).
+
+La API limita lecturas y escrituras por minuto. En vez de disparar llamadas y
+dormir al recibir un 429, cada llamada reserva antes un turno del bucket de su
+tipo ("read" / "write"); si no hay tokens, espera lo justo hasta que los haya.
+Un 429 con Retry-After pausa el bucket para todos los hilos a la vez.
+
+Con almacén compartido (SnapshotStore) el bucket vive en SQLite y lo
+comparten todos los workers del host; si no, es local al proceso.
+"""
+import time
+import threading
+
+
+class QuotaWaitExceeded(RuntimeError):
+    """La espera para obtener turno supera el máximo permitido."""
+
+
+def reserve(state, now, rate, capacity, max_wait):
+    """
+    Reserva un token. `state` = (tokens, updated, paused_until).
+    Devuelve (nuevo_estado, espera_en_segundos) o None si la espera superaría
+    max_wait (en ese caso no se reserva nada). Los tokens pueden quedar en
+    negativo: representan turnos ya reservados por otros.
+    """
+    tokens, updated, paused_until = state
+    tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+    wait = max(paused_until - now, (1 - tokens) / rate if tokens < 1 else 0.0, 0.0)
+    if wait > max_wait:
+        return None
+    return (tokens - 1, now, paused_until), wait
+
+
+class _LocalBuckets:
+    """Estado de los buckets en memoria (un proceso)."""
+
+    def __init__(self):
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, name, rate, capacity, max_wait):
+        now = time.time()
+        with self._lock:
+            state = self._state.get(name, (capacity, now, 0.0))
+            result = reserve(state, now, rate, capacity, max_wait)
+            if result is None:
+                return None
+            self._state[name], wait = result
+            return wait
+
+    def pause(self, name, until):
+        with self._lock:
+            tokens, updated, paused_until = self._state.get(name, (0.0, time.time(), 0.0))
+            self._state[name] = (tokens, updated, max(paused_until, until))
+
+
+class QuotaGovernor:
+    """
+    Buckets por tipo de llamada: limits = {"read": llamadas/min, "write": ...}.
+    `burst` llamadas pueden salir seguidas; el resto se reparte en el minuto
+    de forma que ninguna ventana de 60 s supere el límite.
+    """
+
+    def __init__(self, limits, burst=10, max_wait=20, store=None):
+        self.limits = dict(limits)
+        self.burst = burst
+        self.max_wait = max_wait
+        self.backend = store if store is not None else _LocalBuckets()
+        self._local = threading.local()
+
+    def _params(self, kind):
+        per_minute = self.limits.get(kind) or self.limits["read"]
+        capacity = max(1, min(self.burst, per_minute // 2))
+        rate = max(per_minute - capacity, 1) / 60.0
+        return rate, capacity
+
+    def acquire(self, kind="read"):
+        """Bloquea hasta tener turno; QuotaWaitExceeded si habría que esperar de más."""
+        rate, capacity = self._params(kind)
+        wait = self.backend.reserve(f"sheets:{kind}", rate, capacity, self.max_wait)
+        if wait is None:
+            raise QuotaWaitExceeded(f"Sin turno de cuota '{kind}' en {self.max_wait}s")
+        if wait > 0:
+            time.sleep(wait)
+            self._local.waited = self.waited() + wait
+        return wait
+
+    def waited(self):
+        """Segundos que el hilo actual lleva esperando turno (acumulado)."""
+        return getattr(self._local, "waited", 0.0)
+
+    def pause(self, seconds, kinds=None):
+        """Detiene los buckets `kinds` (todos por defecto) durante `seconds` (Retry-After)."""
+        until = time.time() + seconds
+        for kind in kinds or self.limits:
+            self.backend.pause(f"sheets:{kind}", until)
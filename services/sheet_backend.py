@@ -0,0 +1,333 @@
+# services/sheet_backend.py
+# -*- coding: utf-8 -*-
+"""
+Origen de datos de GoogleSheetService (Config.SHEETS_BACKEND).
+
+El servicio (snapshots, índices, cuota, circuit breaker...) solo necesita
+cuatro operaciones sobre (sheet_id, título de pestaña):
+
+    metadata(sheet_id)                 -> {"id", "title", "worksheets": [títulos]}
+    get_values(sheet_id, title)        -> filas de la pestaña (valores sin formato)
+    batch_get(sheet_id, ranges)        -> [filas por rango A1] en un solo viaje
+    append_rows(sheet_id, title, rows) -> agrega filas al final
+
+- "gspread": la API real (GspreadBackend).
+- "file":    pestañas grabadas en disco, sin red (FileBackend). Para pruebas de
+             carga y benchmarks reproducibles.
+- "record":  la API real, guardando cada pestaña descargada en disco para
+             reproducirla luego con "file" (RecordingBackend). Las lecturas
+             parciales (filas nuevas, encabezado) se integran a la pestaña
+             grabada.
+
+Formato en disco: <dir>/<sheet_id>/<título>.json (lista de filas, como la
+devuelve la API) o <título>.csv (todo texto), y <dir>/<sheet_id>/__metadata__.json.
+"""
+import os
+import abc
+import csv
+import json
+import logging
+import threading
+from urllib.parse import quote, unquote
+
+from gspread.utils import a1_range_to_grid_range
+
+_log = logging.getLogger(__name__)
+
+_RENDER = {"valueRenderOption": "UNFORMATTED_VALUE"}
+_METADATA = "__metadata__.json"
+
+
+def split_range(name):
+    """Rango A1 -> (título, celdas): "'Hoja'!A1:M1" -> ("Hoja", "A1:M1"); "'Hoja'" -> ("Hoja", None)."""
+    if name.startswith("'"):
+        end = name.rfind("'")
+        title, cells = name[1:end].replace("''", "'"), name[end + 1:].lstrip("!")
+    else:
+        title, _, cells = name.partition("!")
+    return title, cells or None
+
+
+def slice_range(values, cells):
+    """Recorta `values` al rango A1 `cells` como lo haría la API (sin celdas vacías al final)."""
+    if not cells:
+        return [list(r) for r in values]
+    grid = a1_range_to_grid_range(cells)
+    rows = values[grid.get("startRowIndex", 0):grid.get("endRowIndex")]
+    c0, c1 = grid.get("startColumnIndex", 0), grid.get("endColumnIndex")
+    out = []
+    for row in rows:
+        row = list(row[c0:c1])
+        while row and row[-1] in ("", None):
+            row.pop()
+        out.append(row)
+    while out and not out[-1]:
+        out.pop()
+    return out
+
+
+def splice_range(values, cells, rows):
+    """
+    Inverso de slice_range: copia de `values` con `rows` (respuesta de la API
+    para el rango A1 `cells`) escrito en su lugar. Las celdas del rango que la
+    API no devolvió quedan vacías (en un rango abierto, hasta el final).
+    """
+    grid = a1_range_to_grid_range(cells)
+    r0, r1 = grid.get("startRowIndex", 0), grid.get("endRowIndex")
+    c0, c1 = grid.get("startColumnIndex", 0), grid.get("endColumnIndex")
+    out = [list(r) for r in values]
+    if r1 is None:
+        r1 = max(len(out), r0 + len(rows))
+    while len(out) < r1:
+        out.append([])
+    for i in range(r0, r1):
+        new = list(rows[i - r0]) if i - r0 < len(rows) else []
+        row = out[i]
+        head = row[:c0] + [""] * (c0 - len(row))
+        if c1 is None:
+            row = head + new
+        else:
+            row = head + new + [""] * (c1 - c0 - len(new)) + row[c1:]
+        while row and row[-1] in ("", None):
+            row.pop()
+        out[i] = row
+    while out and not out[-1]:
+        out.pop()
+    return out
+
+
+class SheetBackend(abc.ABC):
+    """Interfaz común (ver docstring del módulo)."""
+
+    name = "base"
+
+    def connect(self):
+        """Prepara la conexión (autenticación, etc.). Por defecto nada."""
+
+    @abc.abstractmethod
+    def metadata(self, sheet_id):
+        """{"id", "title", "worksheets": [títulos]} del libro."""
+
+    @abc.abstractmethod
+    def get_values(self, sheet_id, title):
+        """Todas las filas de la pestaña."""
+
+    @abc.abstractmethod
+    def batch_get(self, sheet_id, ranges):
+        """Filas de cada rango A1, en el mismo orden que `ranges`."""
+
+    @abc.abstractmethod
+    def append_rows(self, sheet_id, title, rows):
+        """Agrega `rows` al final de la pestaña."""
+
+
+class GspreadBackend(SheetBackend):
+    """
+    Google Sheets vía gspread. Usa el cliente, la caché de libros/pestañas y
+    el gobernador de cuota del servicio.
+    """
+
+    name = "gspread"
+
+    def __init__(self, service):
+        self.service = service
+
+    def connect(self):
+        self.service._ensure_client()
+
+    def _spreadsheet(self, sheet_id):
+        spreadsheet = self.service.get_sheet_by_key(sheet_id)
+        if not spreadsheet:
+            raise LookupError(f"Libro {sheet_id} no disponible")
+        return spreadsheet
+
+    def _worksheet(self, sheet_id, title):
+        ws = self.service._worksheet_by_title(sheet_id, title)
+        if not ws:
+            raise LookupError(f"Hoja '{title}' no disponible")
+        return ws
+
+    def metadata(self, sheet_id):
+        spreadsheet = self._spreadsheet(sheet_id)
+        self.service._quota().acquire("read")
+        return {"id": sheet_id, "title": spreadsheet.title,
+                "worksheets": [ws.title for ws in spreadsheet.worksheets()]}
+
+    def get_values(self, sheet_id, title):
+        ws = self._worksheet(sheet_id, title)
+        self.service._quota().acquire("read")
+        return ws.get_all_values(value_render_option="UNFORMATTED_VALUE")
+
+    def batch_get(self, sheet_id, ranges):
+        spreadsheet = self._spreadsheet(sheet_id)
+        self.service._quota().acquire("read")
+        resp = spreadsheet.values_batch_get(ranges, params=_RENDER)
+        return [vr.get("values") or [] for vr in resp.get("valueRanges", [])]
+
+    def append_rows(self, sheet_id, title, rows):
+        ws = self._worksheet(sheet_id, title)
+        self.service._quota().acquire("write")
+        ws.append_rows(rows, value_input_option="USER_ENTERED")
+
+
+class FileBackend(SheetBackend):
+    """
+    Pestañas grabadas en `root` (ver formato en el docstring del módulo). Las
+    filas agregadas quedan en memoria; con persist=True también se escriben
+    al archivo .json de la pestaña.
+    """
+
+    name = "file"
+
+    def __init__(self, root, persist=False):
+        self.root = root
+        self.persist = persist
+        self._tabs = {}      # (sheet_id, título) -> filas
+        self._lock = threading.Lock()
+
+    def _dir(self, sheet_id):
+        return os.path.join(self.root, quote(sheet_id, safe=""))
+
+    def _path(self, sheet_id, title, ext):
+        return os.path.join(self._dir(sheet_id), quote(title, safe=" -_.") + ext)
+
+    def _load(self, sheet_id, title):
+        key = (sheet_id, title)
+        with self._lock:
+            if key in self._tabs:
+                return self._tabs[key]
+        path = self._path(sheet_id, title, ".json")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                values = json.load(f)
+        else:
+            path = self._path(sheet_id, title, ".csv")
+            if not os.path.exists(path):
+                raise LookupError(f"Hoja '{title}' ({sheet_id}) no grabada en {self.root}")
+            with open(path, encoding="utf-8", newline="") as f:
+                values = [row for row in csv.reader(f)]
+        with self._lock:
+            return self._tabs.setdefault(key, values)
+
+    def metadata(self, sheet_id):
+        path = os.path.join(self._dir(sheet_id), _METADATA)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        if not os.path.isdir(self._dir(sheet_id)):
+            raise LookupError(f"Libro {sheet_id} no grabado en {self.root}")
+        titles = sorted({os.path.splitext(n)[0] for n in os.listdir(self._dir(sheet_id))
+                         if n.endswith((".json", ".csv")) and n != _METADATA})
+        return {"id": sheet_id, "title": sheet_id,
+                "worksheets": [unquote(t) for t in titles]}
+
+    def get_values(self, sheet_id, title):
+        values = self._load(sheet_id, title)
+        with self._lock:
+            return [list(r) for r in values]
+
+    def batch_get(self, sheet_id, ranges):
+        out = []
+        for name in ranges:
+            title, cells = split_range(name)
+            values = self._load(sheet_id, title)
+            with self._lock:
+                out.append(slice_range(values, cells))
+        return out
+
+    def append_rows(self, sheet_id, title, rows):
+        values = self._load(sheet_id, title)
+        with self._lock:
+            values.extend(list(r) for r in rows)
+            if self.persist:
+                write_json(self._path(sheet_id, title, ".json"), values)
+
+
+class RecordingBackend(SheetBackend):
+    """
+    Delega en `inner` (la API real) y graba en `root` cada pestaña que se
+    descarga entera y la metadata de cada libro, en el formato de FileBackend.
+    Los rangos parciales (sondeos, filas nuevas) se integran a la pestaña ya
+    grabada, para que la grabación siga a la hoja entre refrescos; si la
+    pestaña aún no se grabó entera se ignoran.
+    """
+
+    name = "record"
+
+    def __init__(self, inner, root):
+        self.inner = inner
+        self.root = root
+        self._files = FileBackend(root)
+        self._lock = threading.Lock()
+
+    def connect(self):
+        self.inner.connect()
+
+    def _save(self, sheet_id, title, values):
+        try:
+            write_json(self._files._path(sheet_id, title, ".json"), values)
+        except OSError as e:
+            _log.warning("No se pudo grabar '%s' (%s): %s", title, sheet_id, e)
+
+    def _merge(self, sheet_id, title, cells, rows):
+        """Integra un rango parcial a la pestaña grabada (si existe)."""
+        path = self._files._path(sheet_id, title, ".json")
+        with self._lock:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    values = json.load(f)
+            except FileNotFoundError:
+                return
+            except (OSError, ValueError) as e:
+                _log.warning("No se pudo leer la grabación de '%s' (%s): %s", title, sheet_id, e)
+                return
+            self._save(sheet_id, title, splice_range(values, cells, rows))
+
+    def metadata(self, sheet_id):
+        meta = self.inner.metadata(sheet_id)
+        try:
+            write_json(os.path.join(self._files._dir(sheet_id), _METADATA), meta)
+        except OSError as e:
+            _log.warning("No se pudo grabar la metadata de %s: %s", sheet_id, e)
+        return meta
+
+    def get_values(self, sheet_id, title):
+        values = self.inner.get_values(sheet_id, title)
+        with self._lock:
+            self._save(sheet_id, title, values)
+        return values
+
+    def batch_get(self, sheet_id, ranges):
+        out = self.inner.batch_get(sheet_id, ranges)
+        for name, values in zip(ranges, out):
+            title, cells = split_range(name)
+            if cells is None:
+                with self._lock:
+                    self._save(sheet_id, title, values)
+            else:
+                self._merge(sheet_id, title, cells, values)
+        return out
+
+    def append_rows(self, sheet_id, title, rows):
+        self.inner.append_rows(sheet_id, title, rows)
+
+
+def write_json(path, data):
+    """Escritura atómica (tmp + replace) para no dejar archivos a medias."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, default=str)
+    os.replace(tmp, path)
+
+
+def make_backend(service, kind, root):
+    """Backend según Config.SHEETS_BACKEND: "gspread" | "file" | "record"."""
+    kind = (kind or "gspread").lower()
+    if kind == "file":
+        return FileBackend(root)
+    if kind == "record":
+        return RecordingBackend(GspreadBackend(service), root)
+    if kind == "gspread":
+        return GspreadBackend(service)
+    raise ValueError(f"SHEETS_BACKEND desconocido: {kind!r}")
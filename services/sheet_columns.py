@@ -0,0 +1,169 @@
+# services/sheet_columns.py
+# -*- coding: utf-8 -*-
+"""
+Representación columnar de un snapshot.
+
+Cada columna se guarda según su contenido:
+  - DictColumn: pocos valores distintos (PERSONAL, ESPECIALIDAD, TIPO DE PRODUCTO...)
+    -> lista de valores únicos + array de códigos enteros por fila
+  - ArrayColumn: números (int o float) -> array compacto; las celdas que no son
+    del tipo (p. ej. "") se guardan aparte como excepciones
+  - ListColumn: el resto (texto de alta cardinalidad)
+
+La reconstrucción es exacta: column[i] devuelve el mismo valor (y tipo) original.
+"""
+from array import array
+
+
+class ListColumn:
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        return self.data[i]
+
+    def tolist(self):
+        return self.data
+
+    def fingerprint(self):
+        return hash(tuple(self.data))
+
+
+class DictColumn:
+    """Columna codificada con diccionario (valor único -> código entero)."""
+
+    __slots__ = ("values", "codes")
+
+    def __init__(self, values, codes):
+        self.values = values
+        self.codes = codes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+    def tolist(self):
+        values = self.values
+        return [values[c] for c in self.codes]
+
+    def fingerprint(self):
+        return hash((tuple(self.values), self.codes.tobytes()))
+
+    def codes_where(self, pred):
+        """Códigos cuyo valor cumple pred(valor); se evalúa una vez por valor único."""
+        return {c for c, v in enumerate(self.values) if pred(v)}
+
+    def rows_with_codes(self, codes):
+        """Filas (en orden) cuyo código está en `codes`."""
+        if not codes:
+            return []
+        if len(codes) == 1:
+            (only,) = codes
+            return [i for i, c in enumerate(self.codes) if c == only]
+        return [i for i, c in enumerate(self.codes) if c in codes]
+
+
+class ArrayColumn:
+    """Columna numérica en array; `exceptions` guarda {fila: valor} no numéricos."""
+
+    __slots__ = ("data", "exceptions")
+
+    def __init__(self, data, exceptions):
+        self.data = data
+        self.exceptions = exceptions
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        if self.exceptions and i in self.exceptions:
+            return self.exceptions[i]
+        return self.data[i]
+
+    def tolist(self):
+        out = self.data.tolist()
+        for i, v in self.exceptions.items():
+            out[i] = v
+        return out
+
+    def fingerprint(self):
+        return hash((self.data.tobytes(), tuple(self.exceptions.items())))
+
+
+def _typed_key(v):
+    # 1, 1.0 y True son iguales para un dict: se separan por tipo para no mezclarlos
+    return (type(v), v)
+
+
+def encode_column(values, dict_ratio=0.5, max_exceptions=0.1):
+    """Elige la codificación más compacta para una columna (lista de valores)."""
+    n = len(values)
+    if n == 0:
+        return ListColumn([])
+
+    index = {}
+    for v in values:
+        k = _typed_key(v)
+        if k not in index:
+            index[k] = len(index)
+            if len(index) > n * dict_ratio:
+                break
+    if len(index) <= n * dict_ratio:
+        uniques = [k[1] for k in index]
+        typecode = "B" if len(uniques) <= 0xFF else "H" if len(uniques) <= 0xFFFF else "I"
+        return DictColumn(uniques, array(typecode, (index[_typed_key(v)] for v in values)))
+
+    ints = sum(1 for v in values if type(v) is int)
+    floats = sum(1 for v in values if type(v) is float)
+    if ints + floats >= n * (1 - max_exceptions):
+        if floats == 0 and all(-2**63 <= v < 2**63 for v in values if type(v) is int):
+            typecode, num = "q", int
+        elif ints == 0:
+            typecode, num = "d", float
+        else:
+            typecode, num = None, None
+        if typecode:
+            exceptions = {i: v for i, v in enumerate(values) if type(v) is not num}
+            data = array(typecode, (0 if i in exceptions else v for i, v in enumerate(values)))
+            return ArrayColumn(data, exceptions)
+
+    return ListColumn(list(values))
+
+
+class ColumnarTable:
+    """Snapshot guardado por columnas (ver encode_column)."""
+
+    __slots__ = ("columns", "nrows")
+
+    def __init__(self, columns, nrows):
+        self.columns = columns
+        self.nrows = nrows
+
+    @classmethod
+    def from_rows(cls, rows, width):
+        columns = [encode_column([r[j] for r in rows]) for j in range(width)]
+        return cls(columns, len(rows))
+
+    def rows(self):
+        """Materializa las filas como listas (nueva lista en cada llamada)."""
+        if not self.columns:
+            return [[] for _ in range(self.nrows)]
+        return [list(r) for r in zip(*[c.tolist() for c in self.columns])]
+
+    def row(self, i):
+        return [c[i] for c in self.columns]
+
+    def fingerprint(self):
+        """
+        Hash del contenido calculado sobre las columnas ya codificadas (sin
+        materializar filas). Dos tablas con los mismos datos dan el mismo valor
+        dentro del proceso; sirve para detectar cambios, no para persistir.
+        """
+        return hash((self.nrows,) + tuple(c.fingerprint() for c in self.columns))
@@ -0,0 +1,151 @@
+# services/sheet_indexes.py
+# -*- coding: utf-8 -*-
+"""
+Índices de búsqueda que se construyen una vez por snapshot (ver SheetSnapshot.derived).
+
+- DigitIndex: columnas de dígitos (DNI, celular) -> coincidencia exacta por
+  hash y "contiene" por trigramas sobre los valores distintos.
+- TextIndex: texto libre sin tildes ni mayúsculas -> "contiene" por trigramas.
+- RangeIndex: valores ordenables (horas, fechas como date) -> filas en un
+  rango por búsqueda binaria.
+- facet_counts: valores distintos de una columna con su número de filas.
+"""
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import merge
+
+
+def only_digits(v) -> str:
+    return "".join(ch for ch in str(v if v is not None else "") if ch.isdigit())
+
+
+_TILDE = "\u0303"   # virgulilla combinante: n + _TILDE = ñ en NFD
+
+
+def fold(v) -> str:
+    """
+    lower + sin acentos (para búsquedas insensibles a tildes). La ñ se
+    conserva: es otra letra ("año" no es "ano", "PEÑA" no es "PENA").
+    """
+    s = str(v if v is not None else "").lower()
+    out = []
+    for c in unicodedata.normalize("NFD", s):
+        if unicodedata.category(c) == "Mn" and not (c == _TILDE and out and out[-1] == "n"):
+            continue
+        out.append(c)
+    return unicodedata.normalize("NFC", "".join(out))
+
+
+def trigrams(s):
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+class DigitIndex:
+    """
+    Índice sobre una columna ya normalizada a dígitos (una cadena por fila).
+    lookup(q) devuelve las filas cuyo valor es igual a q o lo contiene
+    (con q vacío, solo las filas sin dígitos), en orden de hoja.
+    """
+
+    __slots__ = ("exact", "keys", "grams")
+
+    def __init__(self, values):
+        self.exact = {}
+        for i, v in enumerate(values):
+            ids = self.exact.get(v)
+            if ids is None:
+                ids = self.exact[v] = array("l")
+            ids.append(i)
+        # Trigramas sobre valores distintos: muchas filas comparten DNI/celular
+        self.keys = list(self.exact)
+        self.grams = {}
+        for k, key in enumerate(self.keys):
+            for g in trigrams(key):
+                self.grams.setdefault(g, set()).add(k)
+
+    def _keys_containing(self, q):
+        if len(q) < 3:
+            return [key for key in self.keys if q in key]
+        candidates = None
+        for g in sorted(trigrams(q), key=lambda g: len(self.grams.get(g, ()))):
+            found = self.grams.get(g)
+            if not found:
+                return []
+            candidates = set(found) if candidates is None else candidates & found
+            if not candidates:
+                return []
+        keys = self.keys
+        return [keys[k] for k in candidates if q in keys[k]]
+
+    def lookup(self, q):
+        if not q:
+            return list(self.exact.get("", ()))
+        matched = self._keys_containing(q)
+        if not matched:
+            return []
+        if len(matched) == 1:
+            return list(self.exact[matched[0]])
+        return list(merge(*(self.exact[key] for key in matched)))
+
+
+class TextIndex:
+    """
+    Índice de trigramas sobre un texto por fila (ya normalizado con fold).
+    lookup(q) devuelve, en orden de hoja, las filas cuyo texto contiene q.
+    """
+
+    __slots__ = ("texts", "grams")
+
+    def __init__(self, texts):
+        self.texts = texts
+        grams = {}
+        for i, t in enumerate(texts):
+            for g in trigrams(t):
+                grams.setdefault(g, array("l")).append(i)
+        self.grams = grams
+
+    def lookup(self, q):
+        texts = self.texts
+        if len(q) < 3:
+            return [i for i, t in enumerate(texts) if q in t]
+        postings = []
+        for g in trigrams(q):
+            ids = self.grams.get(g)
+            if not ids:
+                return []
+            postings.append(ids)
+        postings.sort(key=len)
+        candidates = postings[0]
+        for ids in postings[1:]:
+            allowed = set(ids)
+            candidates = [i for i in candidates if i in allowed]
+            if not candidates:
+                return []
+        return [i for i in candidates if q in texts[i]]
+
+
+class RangeIndex:
+    """Filas ordenadas por valor (se omiten None y NaN) para consultas por rango."""
+
+    __slots__ = ("keys", "ids")
+
+    def __init__(self, values):
+        pairs = sorted((v, i) for i, v in enumerate(values) if v is not None and v == v)
+        self.keys = [v for v, _ in pairs]
+        self.ids = array("l", [i for _, i in pairs])
+
+    def between(self, lo=None, hi=None):
+        """Filas con lo <= valor <= hi (límite None = abierto), ordenadas por valor."""
+        start = bisect_left(self.keys, lo) if lo is not None else 0
+        end = bisect_right(self.keys, hi) if hi is not None else len(self.keys)
+        return self.ids[start:end]
+
+
+def facet_counts(values):
+    """[(valor, filas)] de los valores no vacíos, ordenado por valor."""
+    counts = {}
+    for v in values:
+        if v:
+            counts[v] = counts.get(v, 0) + 1
+    return sorted(counts.items())
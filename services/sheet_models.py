@@ -0,0 +1,128 @@
+# services/sheet_models.py
+# -*- coding: utf-8 -*-
+"""
+Registros tipados (con __slots__) que se construyen una vez por snapshot.
+Guardan los valores ya parseados (fechas, montos, código normalizado) para que
+los filtros de cada petición no repitan ese trabajo ni creen dicts por fila.
+"""
+from datetime import date
+
+
+def _fmt(d):
+    return d.strftime("%d/%m/%Y") if d else ""
+
+
+class Venta:
+    """Fila de la hoja de dashboard (ventas del mes)."""
+
+    __slots__ = ("codigo", "fecha", "cliente", "dni", "celular", "producto", "operacion", "monto")
+
+    def __init__(self, codigo, fecha, cliente, dni, celular, producto, operacion, monto):
+        self.codigo = codigo
+        self.fecha = fecha
+        self.cliente = cliente
+        self.dni = dni
+        self.celular = celular
+        self.producto = producto
+        self.operacion = operacion
+        self.monto = monto
+
+    def to_view(self):
+        return {
+            "fecha": _fmt(self.fecha),
+            "cliente": self.cliente,
+            "dni": self.dni,
+            "celular": self.celular,
+            "producto": self.producto,
+            "operacion": self.operacion,
+            "monto": self.monto,
+        }
+
+
+class Cobranza:
+    """Fila de QUERYS vista como cobranza (FECHA DE COBRO = venta + 30 días)."""
+
+    __slots__ = ("codigo", "fecha_venta", "fecha_cobro", "cliente", "dni", "celular", "correo",
+                 "monto_total", "monto_depositado", "especialidad", "observaciones")
+
+    def __init__(self, codigo, fecha_venta, fecha_cobro, cliente, dni, celular, correo,
+                 monto_total, monto_depositado, especialidad, observaciones):
+        self.codigo = codigo
+        self.fecha_venta = fecha_venta
+        self.fecha_cobro = fecha_cobro
+        self.cliente = cliente
+        self.dni = dni
+        self.celular = celular
+        self.correo = correo
+        self.monto_total = monto_total
+        self.monto_depositado = monto_depositado
+        self.especialidad = especialidad
+        self.observaciones = observaciones
+
+    @property
+    def pendiente(self) -> bool:
+        return self.monto_total != self.monto_depositado
+
+    def to_view(self):
+        return {
+            "fecha": _fmt(self.fecha_venta),
+            "fecha_de_cobro": _fmt(self.fecha_cobro),
+            "cliente": self.cliente,
+            "dni": self.dni,
+            "celular": self.celular,
+            "correo": self.correo,
+            "monto_total": self.monto_total,
+            "monto_depositado": self.monto_depositado,
+            "especialidad": self.especialidad,
+            "observaciones": self.observaciones,
+        }
+
+
+class Mencion:
+    """Fila de la hoja MENCIONES."""
+
+    __slots__ = ("nro", "especialidad", "p_certificado", "mencion", "horas",
+                 "f_inicio", "f_termino", "f_emision")
+
+    def __init__(self, nro, especialidad, p_certificado, mencion, horas,
+                 f_inicio, f_termino, f_emision):
+        self.nro = nro
+        self.especialidad = especialidad
+        self.p_certificado = p_certificado
+        self.mencion = mencion
+        self.horas = horas
+        self.f_inicio = f_inicio
+        self.f_termino = f_termino
+        self.f_emision = f_emision
+
+    @property
+    def sort_key(self):
+        """Fecha de inicio (o emisión, o término) para ordenar desc."""
+        return self.f_inicio or self.f_emision or self.f_termino or date(1900, 1, 1)
+
+    def to_view(self):
+        horas = self.horas
+        horas_display = int(horas) if horas and horas.is_integer() else horas if horas is not None else ""
+        return {
+            "nro": self.nro,
+            "especialidad": self.especialidad,
+            "p_certificado": self.p_certificado,
+            "mencion": self.mencion,
+            "horas": horas_display,
+            "f_inicio": _fmt(self.f_inicio),
+            "f_termino": _fmt(self.f_termino),
+            "f_emision": _fmt(self.f_emision),
+        }
+
+
+class Asesor:
+    """Fila de CREDENCIALES con las claves de búsqueda ya normalizadas."""
+
+    __slots__ = ("email", "username", "nombre", "codigo", "comision")
+
+    def __init__(self, email, username, nombre, codigo, comision):
+        self.email = email          # lower + strip
+        self.username = username    # lower + strip
+        self.nombre = nombre        # lower + strip
+        self.codigo = codigo
+        self.comision = comision    # float (fracción) o None si no hay dato válido
@@ -0,0 +1,157 @@
+# services/sheet_scheduler.py
+# -*- coding: utf-8 -*-
+import time
+import logging
+import threading
+from datetime import datetime
+
+_log = logging.getLogger(__name__)
+
+
+class RefreshScheduler:
+    """
+    Refresca en segundo plano los snapshots de todas las hojas configuradas para
+    que las peticiones nunca hagan una carga en frío.
+
+    El intervalo de cada hoja arranca en su TTL y se adapta:
+      - si la hoja cambió desde el último refresh, se acorta (÷2, hasta min_interval)
+      - si no cambió, se alarga (×1.5), sin pasar nunca del TTL del libro ni de
+        max_interval: el TTL es la frescura que el libro promete (p. ej. un
+        cambio de Estado en CREDENCIALES)
+      - fuera del horario laboral se multiplica por off_hours_factor; entonces
+        es una lectura vencida la que refresca la hoja (ver _get_snapshot)
+    """
+
+    def __init__(self, service, min_interval=30, max_interval=900,
+                 business_hours=(8, 20), off_hours_factor=4):
+        self.service = service
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.business_hours = business_hours
+        self.off_hours_factor = off_hours_factor
+
+        self._stats = {}     # (sheet_id, título) -> dict de métricas
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ----------------------------------------------------------
+    # Ciclo de vida
+    # ----------------------------------------------------------
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sheets-scheduler", daemon=True)
+        self._thread.start()
+        _log.info("Scheduler de Google Sheets iniciado")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    # ----------------------------------------------------------
+    # Consulta
+    # ----------------------------------------------------------
+    def stats(self):
+        """Copia de las métricas por hoja: último refresh, duración, intervalo, etc."""
+        with self._lock:
+            return {key: dict(st) for key, st in self._stats.items()}
+
+    # ----------------------------------------------------------
+    # Internos
+    # ----------------------------------------------------------
+    def _in_business_hours(self, now=None) -> bool:
+        start, end = self.business_hours
+        hour = (now or datetime.now()).hour
+        return start <= hour < end
+
+    def _sync_sources(self):
+        """Da de alta las hojas configuradas que aún no tienen métricas."""
+        now = time.time()
+        with self._lock:
+            for key, ttl in self.service._configured_sources().items():
+                if key not in self._stats:
+                    self._stats[key] = {
+                        "base_interval": float(ttl),
+                        "interval": float(ttl),
+                        "next_due": now,
+                        "last_refresh": None,
+                        "last_duration": None,
+                        "last_error": None,
+                        "changes": 0,
+                        "refreshes": 0,
+                        "rows": 0,
+                        "version": 0,
+                    }
+
+    def _next_interval(self, st, changed):
+        if changed:
+            interval = max(self.min_interval, st["interval"] / 2.0)
+        else:
+            interval = min(self.max_interval, st["base_interval"], st["interval"] * 1.5)
+        return interval
+
+    def _refresh(self, keys):
+        """Refresca las hojas vencidas en una sola pasada (batchGet por libro)."""
+        prevs = {key: self.service._snapshots.get(key) for key in keys}
+        t0 = time.time()
+        snaps = self.service._refresh_snapshots(keys)
+        duration = time.time() - t0
+        wait_factor = 1 if self._in_business_hours() else self.off_hours_factor
+
+        # Fuera del lock: comparar huellas recorre las columnas de cada hoja
+        outcome = {}
+        for key in keys:
+            prev, snap = prevs[key], snaps.get(key)
+            # Mismo objeto con fetched_at renovado: el sondeo verificó que no cambió
+            ok = snap is not None and (snap is not prev or snap.fetched_at >= t0)
+            # Una descarga completa siempre crea versión nueva: cambió solo si
+            # además cambió el contenido
+            changed = (ok and prev is not None and snap.version != prev.version
+                       and snap.fingerprint() != prev.fingerprint())
+            outcome[key] = (ok, changed)
+
+        with self._lock:
+            for key in keys:
+                snap = snaps.get(key)
+                ok, changed = outcome[key]
+                prev = prevs[key]
+
+                st = self._stats[key]
+                st["refreshes"] += 1
+                st["last_duration"] = round(duration, 3)
+                if ok:
+                    st["last_refresh"] = t0
+                    st["last_error"] = None
+                    st["rows"] = len(snap)
+                    st["version"] = snap.version
+                    if changed:
+                        st["changes"] += 1
+                    if prev is not None:
+                        st["interval"] = self._next_interval(st, changed)
+                else:
+                    st["last_error"] = t0
+                    st["interval"] = max(self.min_interval, st["interval"])
+                st["next_due"] = time.time() + st["interval"] * wait_factor
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._sync_sources()
+                now = time.time()
+                due = [k for k, st in self.stats().items() if st["next_due"] <= now]
+                if due:
+                    self._refresh(due)
+                pending = [st["next_due"] for st in self.stats().values()]
+                timeout = max(1.0, min(pending) - time.time()) if pending else self.min_interval
+            except Exception as e:
+                _log.warning("Error en scheduler de Sheets: %s", e, exc_info=True)
+                timeout = self.min_interval
+            self._stop.wait(timeout)
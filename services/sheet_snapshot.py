@@ -0,0 +1,82 @@
+# services/sheet_snapshot.py
+# -*- coding: utf-8 -*-
+import time
+import threading
+
+from services.sheet_columns import ColumnarTable
+
+
+def normalize_values(values):
+    """
+    Separa la salida de get_all_values en (headers, rows).
+    Cada fila se rellena/recorta al largo de los encabezados.
+    """
+    if not values:
+        return [], []
+    headers = [h.strip() if isinstance(h, str) else h for h in (values[0] or [])]
+    width = len(headers)
+    rows = []
+    for r in values[1:]:
+        r = list(r)
+        if len(r) < width:
+            r = r + [""] * (width - len(r))
+        elif len(r) > width:
+            r = r[:width]
+        rows.append(r)
+    return headers, rows
+
+
+class SheetSnapshot:
+    """
+    Foto inmutable de una hoja (encabezados + filas) con número de versión.
+    Los datos se guardan por columnas (ver sheet_columns); `rows` los materializa.
+    Las estructuras derivadas (índices, modelos) se construyen una vez por
+    snapshot con `derived()` y mueren con él.
+    """
+
+    __slots__ = ("key", "version", "headers", "table", "fetched_at", "_derived", "_lock")
+
+    def __init__(self, key, version, headers, rows, fetched_at=None):
+        self.key = key
+        self.version = version
+        self.headers = headers
+        self.table = ColumnarTable.from_rows(rows, len(headers))
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        self._derived = {}
+        self._lock = threading.RLock()
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    def __len__(self):
+        return self.table.nrows
+
+    @property
+    def rows(self):
+        """Filas como listas (se materializan en cada acceso)."""
+        return self.table.rows()
+
+    def records(self):
+        """Lista de dicts nueva en cada llamada (el llamador puede mutarla)."""
+        headers = self.headers
+        return [dict(zip(headers, r)) for r in self.table.rows()]
+
+    def record(self, i):
+        """Fila `i` como dict {encabezado: valor}."""
+        return dict(zip(self.headers, self.table.row(i)))
+
+    def fingerprint(self):
+        """Hash de encabezados + datos (ver ColumnarTable.fingerprint), una vez por snapshot."""
+        return self.derived("fingerprint", lambda snap: hash((tuple(snap.headers), snap.table.fingerprint())))
+
+    def derived(self, name, builder):
+        """Devuelve la estructura `name`, construyéndola con builder(self) si falta."""
+        try:
+            return self._derived[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._derived:
+                self._derived[name] = builder(self)
+            return self._derived[name]
@@ -0,0 +1,189 @@
+# services/snapshot_store.py
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import uuid
+import zlib
+import sqlite3
+import logging
+import threading
+
+from services.quota import reserve
+
+_log = logging.getLogger(__name__)
+
+
+class SnapshotStore:
+    """
+    Almacén de snapshots compartido por todos los workers de un mismo host
+    (archivo SQLite en modo WAL).
+
+    - Un solo worker descarga cada hoja: el que obtiene el "lease" de la clave.
+    - Los demás leen la última versión publicada sin llamar a la API.
+    - Cada publicación reemplaza la fila en una transacción, así que un lector
+      ve la versión anterior completa o la nueva completa, nunca una mezcla.
+    """
+
+    def __init__(self, path, lease_seconds=60):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._local = threading.local()
+        self._init_schema()
+
+    # ----------------------------------------------------------
+    # Conexión (una por hilo; sqlite3 no comparte conexiones entre hilos)
+    # ----------------------------------------------------------
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            " sheet_id TEXT NOT NULL, title TEXT NOT NULL,"
+            " version INTEGER NOT NULL, fetched_at REAL NOT NULL, payload BLOB NOT NULL,"
+            " PRIMARY KEY (sheet_id, title))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS quota ("
+            " name TEXT PRIMARY KEY, tokens REAL NOT NULL,"
+            " updated REAL NOT NULL, paused_until REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            " sheet_id TEXT NOT NULL, title TEXT NOT NULL,"
+            " owner TEXT NOT NULL, expires REAL NOT NULL,"
+            " PRIMARY KEY (sheet_id, title))"
+        )
+
+    # ----------------------------------------------------------
+    # Snapshots
+    # ----------------------------------------------------------
+    def meta(self, key):
+        """(version, fetched_at) publicados para la clave, o None."""
+        row = self._conn().execute(
+            "SELECT version, fetched_at FROM snapshots WHERE sheet_id=? AND title=?", key
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def load(self, key):
+        """(version, fetched_at, headers, rows) publicados para la clave, o None."""
+        row = self._conn().execute(
+            "SELECT version, fetched_at, payload FROM snapshots WHERE sheet_id=? AND title=?", key
+        ).fetchone()
+        if not row:
+            return None
+        data = json.loads(zlib.decompress(row[2]))
+        return row[0], row[1], data["headers"], data["rows"]
+
+    def save(self, key, headers, rows, fetched_at=None):
+        """Publica una nueva versión y devuelve su número."""
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+        payload = zlib.compress(json.dumps({"headers": headers, "rows": rows},
+                                           ensure_ascii=False, default=str).encode("utf-8"))
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT version FROM snapshots WHERE sheet_id=? AND title=?", key
+            ).fetchone()
+            version = (row[0] if row else 0) + 1
+            conn.execute(
+                "INSERT OR REPLACE INTO snapshots (sheet_id, title, version, fetched_at, payload)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key[0], key[1], version, fetched_at, payload),
+            )
+            conn.execute("COMMIT")
+            return version
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def touch(self, key, fetched_at=None):
+        """Marca la versión publicada como recién verificada (sin cambios)."""
+        self._conn().execute(
+            "UPDATE snapshots SET fetched_at=? WHERE sheet_id=? AND title=?",
+            (fetched_at if fetched_at is not None else time.time(), key[0], key[1]),
+        )
+
+    def expire(self, key):
+        """Marca la versión publicada como vencida (p. ej. tras una escritura)."""
+        self._conn().execute(
+            "UPDATE snapshots SET fetched_at=0 WHERE sheet_id=? AND title=?", key
+        )
+
+    def clear(self):
+        self._conn().execute("DELETE FROM snapshots")
+
+    # ----------------------------------------------------------
+    # Cuota compartida (buckets de services/quota.py)
+    # ----------------------------------------------------------
+    def reserve(self, name, rate, capacity, max_wait):
+        """Reserva un token del bucket `name`; devuelve la espera o None (ver quota.reserve)."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated, paused_until FROM quota WHERE name=?", (name,)
+            ).fetchone()
+            result = reserve(row or (capacity, now, 0.0), now, rate, capacity, max_wait)
+            if result is None:
+                conn.execute("ROLLBACK")
+                return None
+            (tokens, updated, paused_until), wait = result
+            conn.execute(
+                "INSERT OR REPLACE INTO quota (name, tokens, updated, paused_until) VALUES (?, ?, ?, ?)",
+                (name, tokens, updated, paused_until),
+            )
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def pause(self, name, until):
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO quota (name, tokens, updated, paused_until) VALUES (?, 0, ?, ?)"
+            " ON CONFLICT(name) DO UPDATE SET paused_until=MAX(paused_until, excluded.paused_until)",
+            (name, time.time(), until),
+        )
+
+    # ----------------------------------------------------------
+    # Leases (quién refresca cada hoja)
+    # ----------------------------------------------------------
+    def try_acquire(self, key) -> bool:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT owner, expires FROM leases WHERE sheet_id=? AND title=?", key
+            ).fetchone()
+            if row and row[0] != self.owner and row[1] > now:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (sheet_id, title, owner, expires) VALUES (?, ?, ?, ?)",
+                (key[0], key[1], self.owner, now + self.lease_seconds),
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def release(self, key):
+        self._conn().execute(
+            "DELETE FROM leases WHERE sheet_id=? AND title=? AND owner=?",
+            (key[0], key[1], self.owner),
+        )
@@ -0,0 +1,73 @@
+# services/token_refresher.py
+# -*- coding: utf-8 -*-
+import logging
+import threading
+from datetime import datetime, timezone
+
+_log = logging.getLogger(__name__)
+
+
+class TokenRefresher:
+    """
+    Renueva el token OAuth de la cuenta de servicio en segundo plano, `margin`
+    segundos antes de que venza, para que ninguna petición tenga que esperar
+    el viaje al endpoint de tokens. Si la renovación falla se reintenta cada
+    `retry` segundos (mientras tanto la sesión lo renueva sola al usarse).
+    """
+
+    def __init__(self, creds, request, margin=300, retry=30):
+        self.creds = creds
+        self.request = request
+        self.margin = margin
+        self.retry = retry
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ----------------------------------------------------------
+    # Ciclo de vida
+    # ----------------------------------------------------------
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sheets-token-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    # ----------------------------------------------------------
+    # Internos
+    # ----------------------------------------------------------
+    def _seconds_left(self):
+        """Segundos hasta el vencimiento del token (None si no se conoce)."""
+        expiry = getattr(self.creds, "expiry", None)
+        if expiry is None:
+            return None
+        # google-auth guarda expiry como datetime UTC sin zona horaria
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return (expiry - now).total_seconds()
+
+    def _run(self):
+        while not self._stop.is_set():
+            left = self._seconds_left()
+            if left is None:
+                wait = self.retry
+            else:
+                # Tokens de vida corta: a mitad de camino (evita un bucle de renovaciones)
+                wait = left - self.margin if left > 2 * self.margin else left / 2
+            if wait > 0 and self._stop.wait(wait):
+                break
+            try:
+                self.creds.refresh(self.request)
+                _log.debug("Token de Google renovado (vence %s)", self.creds.expiry)
+            except Exception as e:
+                _log.warning("No se pudo renovar el token de Google: %s", e)
+                self._stop.wait(self.retry)
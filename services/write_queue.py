@@ -0,0 +1,412 @@
+# services/write_queue.py
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import uuid
+import fcntl
+import logging
+import threading
+
+_log = logging.getLogger(__name__)
+
+_WRITTEN = "written"   # subdirectorio con las filas ya escritas (estado de tickets)
+_FAILED = "failed"     # filas descartadas tras max_attempts intentos (no se borran)
+
+
+def _claim(lock_path):
+    """
+    Toma el lock exclusivo de un dueño del spool sin esperar. Devuelve el
+    archivo abierto (hay que cerrarlo para soltarlo) o None si otro lo tiene.
+    """
+    try:
+        f = open(lock_path, "a")
+    except OSError:
+        return None
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def spool_status(spool_dir, ticket):
+    """
+    Estado de un ticket visto desde el spool (lo comparten todos los workers):
+    archivo pendiente -> "pending", marca en written/ -> "written", archivo en
+    failed/ -> "failed", si no None.
+    """
+    try:
+        names = os.listdir(spool_dir)
+    except OSError:
+        return None
+    suffix = f"-{ticket}.json"
+    for name in names:
+        if name.endswith(suffix):
+            try:
+                with open(os.path.join(spool_dir, name), encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            return {"state": "pending", "key": [entry["sheet_id"], entry["title"]],
+                    "queued_at": entry["queued_at"], "written_at": None,
+                    "error": None, "attempts": 0}
+    failed = os.path.join(spool_dir, _FAILED, f"{ticket}.json")
+    try:
+        with open(failed, encoding="utf-8") as f:
+            entry = json.load(f)
+        return {"state": "failed", "key": [entry["sheet_id"], entry["title"]],
+                "queued_at": entry["queued_at"], "written_at": None,
+                "error": entry.get("error"), "attempts": entry.get("attempts", 0)}
+    except (OSError, ValueError):
+        pass
+    done = os.path.join(spool_dir, _WRITTEN, f"{ticket}.json")
+    try:
+        with open(done, encoding="utf-8") as f:
+            entry = json.load(f)
+        written_at = os.path.getmtime(done)
+    except (OSError, ValueError):
+        return None
+    return {"state": "written", "key": [entry["sheet_id"], entry["title"]],
+            "queued_at": entry["queued_at"], "written_at": written_at,
+            "error": None, "attempts": 0}
+
+
+class WriteQueue:
+    """
+    Cola de escritura diferida (write-behind) para add_record.
+
+    - enqueue() guarda la fila en el spool local (un archivo JSON por fila,
+      con fsync) y devuelve un ticket de inmediato.
+    - Un hilo junta cada `interval` segundos las filas pendientes de cada hoja
+      y las escribe con un solo append_rows.
+    - Si la escritura falla, las filas siguen en el spool y la hoja se
+      reintenta con espera exponencial (interval, ×2, hasta max_backoff); la
+      primera fila pendiente se reintenta sola para no arrastrar a las demás.
+      Una fila que falla `max_attempts` veces pasa a failed/ (estado "failed")
+      y deja pasar a las siguientes. Los errores `transient` (la llamada no
+      llegó a Google: circuito abierto, cuota propia) no cuentan como intento.
+    - Al arrancar (y cada `recover_every` segundos) se recuperan los archivos
+      que dejó un worker que ya no existe.
+    - status(ticket) informa si la fila sigue pendiente, ya se escribió o se
+      descartó; las filas escritas pasan a written/ para que cualquier worker
+      lo sepa (ver spool_status).
+
+    Los archivos llevan en el nombre el dueño que los creó (pid + id de
+    arranque, así un pid reutilizado tras un reinicio no se confunde con el
+    anterior). Cada dueño mantiene tomado un flock sobre <dueño>.lock mientras
+    vive: si el lock está libre, el dueño murió y sus filas se adoptan.
+    """
+
+    def __init__(self, service, spool_dir, interval=2.0, max_batch=500, keep_status=3600,
+                 recover_every=30, max_attempts=8, max_backoff=300, transient=()):
+        self.service = service
+        self.spool_dir = spool_dir
+        self.interval = interval
+        self.max_batch = max_batch
+        self.keep_status = keep_status
+        self.recover_every = recover_every
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.transient = tuple(transient)
+        self.owner = f"{os.getpid()}.{uuid.uuid4().hex[:12]}"
+
+        self._pending = {}   # (sheet_id, título) -> [entrada, ...] en orden de llegada
+        self._status = {}    # ticket -> {"state", "key", "queued_at", "written_at", "error", "attempts"}
+        self._retry = {}     # (sheet_id, título) -> (no antes de, espera actual) tras un fallo
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()   # una sola escritura por hoja a la vez
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        os.makedirs(os.path.join(spool_dir, _WRITTEN), exist_ok=True)
+        os.makedirs(os.path.join(spool_dir, _FAILED), exist_ok=True)
+        self._owner_lock = self._claim_owner()
+        self._recovered_at = 0.0
+        self._recover()
+
+    # ----------------------------------------------------------
+    # Ciclo de vida
+    # ----------------------------------------------------------
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sheets-write-queue", daemon=True)
+        self._thread.start()
+
+    def stop(self, flush=True):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        self._thread = None
+        if flush:
+            self.flush()
+
+    def release(self):
+        """
+        Suelta el lock de dueño (lo que quede pendiente lo adoptará otro
+        worker). Sin filas propias en el spool, además borra el archivo .lock.
+        """
+        if self._owner_lock is None:
+            return
+        prefix = f"{self.owner}-"
+        try:
+            empty = not any(n.startswith(prefix) and n.endswith(".json")
+                            for n in os.listdir(self.spool_dir))
+        except OSError:
+            empty = False
+        if empty:
+            # Se borra antes de soltarlo: nadie puede tomarlo entre medio
+            try:
+                os.remove(os.path.join(self.spool_dir, f"{self.owner}.lock"))
+            except OSError:
+                pass
+        self._owner_lock.close()
+        self._owner_lock = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    # ----------------------------------------------------------
+    # API
+    # ----------------------------------------------------------
+    def enqueue(self, key, row):
+        """Encola `row` para la hoja `key` = (sheet_id, título) y devuelve su ticket."""
+        ticket = uuid.uuid4().hex
+        entry = {"ticket": ticket, "sheet_id": key[0], "title": key[1],
+                 "row": list(row), "queued_at": time.time()}
+        entry["path"] = self._spool(entry)
+        with self._lock:
+            self._pending.setdefault(key, []).append(entry)
+            self._status[ticket] = {"state": "pending", "key": key, "queued_at": entry["queued_at"],
+                                    "written_at": None, "error": None, "attempts": 0}
+        return ticket
+
+    def status(self, ticket):
+        """Estado de un ticket ("pending" | "written" | "failed") o None si no se conoce."""
+        with self._lock:
+            st = self._status.get(ticket)
+            if not st:
+                return spool_status(self.spool_dir, ticket)
+            out = dict(st)
+        out["key"] = list(out["key"])
+        return out
+
+    def pending_count(self, key=None) -> int:
+        with self._lock:
+            if key is not None:
+                return len(self._pending.get(key, ()))
+            return sum(len(v) for v in self._pending.values())
+
+    def flush(self):
+        """Escribe ya lo pendiente (un append_rows por hoja), salvo hojas en espera tras un fallo."""
+        now = time.time()
+        with self._lock:
+            keys = [k for k, v in self._pending.items()
+                    if v and self._retry.get(k, (0.0, 0.0))[0] <= now]
+            # Los tickets ya escritos (o descartados) se recuerdan solo keep_status
+            # segundos; después responde el spool
+            limit = now - self.keep_status
+            for t in [t for t, st in self._status.items()
+                      if st["state"] != "pending" and (st["written_at"] or st["queued_at"]) < limit]:
+                del self._status[t]
+        with self._flush_lock:
+            for key in keys:
+                self._flush_key(key)
+        self._prune_written(limit)
+
+    # ----------------------------------------------------------
+    # Internos
+    # ----------------------------------------------------------
+    def _spool(self, entry):
+        name = f"{self.owner}-{entry['queued_at']:.6f}-{entry['ticket']}.json"
+        path = os.path.join(self.spool_dir, name)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({k: v for k, v in entry.items() if k != "path"}, f, ensure_ascii=False, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        return path
+
+    def _claim_owner(self):
+        """
+        Lock de dueño propio. Entre crear el .lock y tomarlo, un _recover de otro
+        worker podría verlo libre y borrarlo: si el archivo ya no existe se
+        vuelve a crear.
+        """
+        path = os.path.join(self.spool_dir, f"{self.owner}.lock")
+        for _ in range(3):
+            claim = _claim(path)
+            if claim is None or os.fstat(claim.fileno()).st_nlink:
+                return claim
+            claim.close()
+        return None
+
+    def _recover(self):
+        """
+        Adopta los archivos del spool de dueños que ya no están vivos y borra
+        los .lock de dueños muertos sin filas pendientes.
+        """
+        self._recovered_at = time.time()
+        by_owner = {}
+        for name in os.listdir(self.spool_dir):
+            if name.endswith(".json") and "-" in name:
+                by_owner.setdefault(name.split("-", 1)[0], []).append(name)
+            elif name.endswith(".lock"):
+                by_owner.setdefault(name[:-len(".lock")], [])
+        by_owner.pop(self.owner, None)
+
+        recovered = []
+        for owner, names in by_owner.items():
+            lock_path = os.path.join(self.spool_dir, f"{owner}.lock")
+            claim = _claim(lock_path)
+            if claim is None:
+                continue  # dueño vivo (u otro worker adoptándolo ahora)
+            if not names:
+                # Dueño muerto sin filas (o un .lock recién creado por _claim)
+                try:
+                    os.remove(lock_path)
+                except OSError:
+                    pass
+                claim.close()
+                continue
+            try:
+                for name in sorted(names, key=lambda n: n.split("-", 1)[1]):
+                    old = os.path.join(self.spool_dir, name)
+                    new = os.path.join(self.spool_dir, f"{self.owner}-{name.split('-', 1)[1]}")
+                    try:
+                        os.rename(old, new)
+                        with open(new, encoding="utf-8") as f:
+                            entry = json.load(f)
+                    except (OSError, ValueError) as e:
+                        _log.debug("No se pudo recuperar %s del spool: %s", name, e)
+                        continue
+                    entry["path"] = new
+                    recovered.append(entry)
+                try:
+                    os.remove(lock_path)
+                except OSError:
+                    pass
+            finally:
+                claim.close()
+
+        recovered.sort(key=lambda e: e["queued_at"])
+        with self._lock:
+            for entry in recovered:
+                key = (entry["sheet_id"], entry["title"])
+                self._pending.setdefault(key, []).append(entry)
+                self._status[entry["ticket"]] = {"state": "pending", "key": key,
+                                                 "queued_at": entry["queued_at"],
+                                                 "written_at": None, "error": None, "attempts": 0}
+        if recovered:
+            _log.info("Cola de escritura: %s filas recuperadas del spool", len(recovered))
+
+    def _prune_written(self, limit):
+        done_dir = os.path.join(self.spool_dir, _WRITTEN)
+        try:
+            names = os.listdir(done_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(done_dir, name)
+            try:
+                if os.path.getmtime(path) < limit:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _flush_key(self, key):
+        with self._lock:
+            pending = self._pending.get(key, ())
+            if not pending:
+                return
+            # Tras un fallo la primera fila va sola: si es ella la que no se
+            # puede escribir, no arrastra a las que vienen detrás
+            head = self._status.get(pending[0]["ticket"]) or {}
+            batch = list(pending[:1] if head.get("error") else pending[:self.max_batch])
+        tickets = [e["ticket"] for e in batch]
+        try:
+            self.service._append_rows(key, [e["row"] for e in batch])
+        except Exception as e:
+            self._flush_failed(key, batch, e)
+            return
+
+        now = time.time()
+        with self._lock:
+            self._retry.pop(key, None)
+            done = set(tickets)
+            self._pending[key] = [e for e in self._pending.get(key, ()) if e["ticket"] not in done]
+            for t in tickets:
+                st = self._status.get(t)
+                if st:
+                    st.update(state="written", written_at=now, error=None)
+        for entry in batch:
+            # written/<ticket>.json: cualquier worker puede responder su estado
+            done = os.path.join(self.spool_dir, _WRITTEN, f"{entry['ticket']}.json")
+            try:
+                os.replace(entry["path"], done)
+                os.utime(done, (now, now))
+            except OSError:
+                pass
+        self.service._rows_written(key, tickets)
+
+    def _flush_failed(self, key, batch, error):
+        """Cuenta el intento, programa el reintento de la hoja y descarta lo que agotó sus intentos."""
+        counted = not isinstance(error, self.transient)
+        now = time.time()
+        failed = []
+        with self._lock:
+            for entry in batch:
+                st = self._status.get(entry["ticket"])
+                if not st:
+                    continue
+                st["error"] = str(error)
+                if counted:
+                    st["attempts"] += 1
+                    if st["attempts"] >= self.max_attempts:
+                        failed.append(entry)
+            delay = min(self.max_backoff, max(self.interval, 2 * self._retry.get(key, (0.0, 0.0))[1]))
+            self._retry[key] = (now + delay, delay)
+            if failed:
+                gone = {e["ticket"] for e in failed}
+                self._pending[key] = [e for e in self._pending.get(key, ()) if e["ticket"] not in gone]
+                for t in gone:
+                    self._status[t]["state"] = "failed"
+                # Lo que sigue en la hoja no tiene por qué fallar: sin espera
+                self._retry.pop(key, None)
+        _log.warning("Cola de escritura: no se pudieron escribir %s filas en '%s': %s",
+                     len(batch), key[1], error)
+        if not failed:
+            return
+        _log.error("Cola de escritura: %s filas descartadas en '%s' tras %s intentos (ver %s/): %s",
+                   len(failed), key[1], self.max_attempts, _FAILED, error)
+        for entry in failed:
+            record = {k: v for k, v in entry.items() if k != "path"}
+            record.update(error=str(error), attempts=self.max_attempts, failed_at=now)
+            path = os.path.join(self.spool_dir, _FAILED, f"{entry['ticket']}.json")
+            try:
+                tmp = path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(record, f, ensure_ascii=False, default=str)
+                os.replace(tmp, path)
+                os.remove(entry["path"])
+            except OSError as e:
+                _log.warning("No se pudo mover %s a %s/: %s", entry["path"], _FAILED, e)
+        self.service._rows_failed(key, [e["ticket"] for e in failed])
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                if time.time() - self._recovered_at >= self.recover_every:
+                    self._recover()
+                self.flush()
+            except Exception as e:
+                _log.warning("Cola de escritura: error inesperado: %s", e)
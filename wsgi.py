@@ -1,4 +1,11 @@
 # wsgi.py
+# Entrada para gunicorn:  gunicorn -w 4 wsgi:app   (también con --preload)
+# Con SHEETS_WARMUP=1 cada worker (o el master, con --preload) precarga las
+# hojas antes de aceptar tráfico, esperando hasta SHEETS_WARMUP_TIMEOUT s; si
+# no alcanza, la precarga sigue en segundo plano y /readyz responde 503.
+# Con --preload los workers heredan los snapshots del master y vuelven a
+# arrancar sus propios hilos (scheduler, cola de escritura) tras el fork.
 from app import create_app
+from config import Config
 
-app = create_app()
+app = create_app(warm_up_timeout=Config.SHEETS_WARMUP_TIMEOUT)